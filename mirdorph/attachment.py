@@ -13,9 +13,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import asyncio
 import logging
-import threading
 import subprocess
 import discord
 import os
@@ -23,6 +21,7 @@ from gettext import gettext as _
 from enum import Enum
 from pathlib import Path
 from gi.repository import Adw, Gtk, Gio, GObject, GLib, GdkPixbuf
+from .scheduler import TaskCategory, CancellationScope, run_on_discord
 
 
 class AttachmentType(Enum):
@@ -50,6 +49,13 @@ class MirdorphAttachment:
         """
         pass
 
+    def discard(self):
+        """
+        Stop the background work of the attachment,
+        when it isn't displayed anymore.
+        """
+        pass
+
 
 @Gtk.Template(resource_path="/org/gnome/gitlab/ranchester/Mirdorph/ui/generic_attachment.ui")
 class GenericAttachment(Gtk.ListBox, MirdorphAttachment):
@@ -86,7 +92,7 @@ class GenericAttachment(Gtk.ListBox, MirdorphAttachment):
         logging.info(f"saving attachment {self._attachment_disc.url}")
         self._download_button.set_sensitive(False)
         GLib.timeout_add(250, self._pulse_target)
-        threading.Thread(target=self._save_attachment_target).start()
+        self.app.scheduler.submit(TaskCategory.NETWORK, self._save_attachment_target)
 
     def _pulse_target(self):
         if not self._finished_download:
@@ -103,13 +109,19 @@ class GenericAttachment(Gtk.ListBox, MirdorphAttachment):
         # Output adds trailing new line
         download_dir = subprocess.check_output("xdg-user-dir DOWNLOAD", shell=True, text=True).rstrip()
 
-        asyncio.run_coroutine_threadsafe(
+        # The download itself doesn't need to keep this worker waiting
+        run_on_discord(
             self._do_save(download_dir),
-            self.app.discord_loop
-        ).result()
+            callback=self._save_attachment_gtk_target,
+            error_callback=self._save_attachment_error_gtk_target
+        )
 
+    def _save_attachment_gtk_target(self, result):
         self._finished_download = True
-        GLib.idle_add(lambda *_ : self._download_button_image.set_from_icon_name("emblem-ok-symbolic", 4))
+        self._download_button_image.set_from_icon_name("emblem-ok-symbolic", 4)
+
+    def _save_attachment_error_gtk_target(self, error: Exception):
+        logging.error(f"failed to save attachment {self._attachment_disc.url}", exc_info=error)
 
 class ImageAttachmentLoadingTemplate(Adw.Bin):
     """
@@ -145,6 +157,7 @@ class ImageAttachment(MirdorphAttachment, Adw.Bin):
         Adw.Bin.__init__(self, *args, **kwargs)
         self.app = Gio.Application.get_default()
         self._fully_loaded = False
+        self._scope = CancellationScope()
         self.image_save_path = self.get_image_save_path(
             self._attachment_disc.id,
             self._attachment_disc.filename
@@ -215,15 +228,10 @@ class ImageAttachment(MirdorphAttachment, Adw.Bin):
         self._image_stack.add_child(self._template_image)
 
     def _do_full_render_at(self):
-        threading.Thread(target=self._fetch_image_target).start()
-
-    def _fetch_image_target(self):
-        asyncio.run_coroutine_threadsafe(
+        self._scope.run_on_discord(
             self._attachment_disc.save(str(self.image_save_path)),
-            self.app.discord_loop
-        ).result()
-
-        GLib.idle_add(self._load_image_gtk_target)
+            callback=lambda _ : self._load_image_gtk_target()
+        )
 
     def _load_image_gtk_target(self):
         if self.image_save_path.is_file():
@@ -245,6 +253,9 @@ class ImageAttachment(MirdorphAttachment, Adw.Bin):
     def do_image_fully_loaded(self):
         self._fully_loaded = True
 
+    def discard(self):
+        self._scope.cancel()
+
 def get_attachment_type(attachment: discord.Attachment) -> str:
     """
     Get the attachment type of the att
@@ -277,7 +288,7 @@ class MessageEntryBarAttachment(Gtk.Button):
             self.add_mode = False
             self.set_sensitive(False)
             self._mode_stack.set_visible_child(self._mode_content_box)
-            threading.Thread(target=self._load_details_target).start()
+            Gio.Application.get_default().scheduler.submit(TaskCategory.IO, self._load_details_target)
 
     def _load_details_target(self):
         # Not really useful to have separate thread with only name,
@@ -113,6 +113,9 @@ class ChannelInnerWindow(Gtk.Box):
             self._content_box.append(self._message_entry_bar)
 
             self._msg_sending_scrl_mode_en = False
+            # Message to scroll to on the first history load, when woken
+            # up from hibernation
+            self._restore_anchor = None
 
             self._context_action_group = Gio.SimpleActionGroup()
             prop_action = Gio.SimpleAction.new("properties", None)
@@ -152,7 +155,39 @@ class ChannelInnerWindow(Gtk.Box):
         Load the initial history view, designed for
         when first displaying.
         """
-        self._message_view.load_history()
+        self._message_view.load_history(anchor=self._restore_anchor)
+        self._restore_anchor = None
+
+    @property
+    def history_prefetcher(self):
+        """
+        The `HistoryPrefetcher` of the message view, for its counters
+        """
+        return self._message_view.prefetcher
+
+    def get_snapshot(self) -> dict:
+        """
+        Get the state that should survive hibernation, a small dict
+        (draft text, attachment filenames, scroll anchor message id) that
+        can be given to `restore_snapshot` of a new context of the channel.
+        """
+        text, attachments = self._message_entry_bar.get_draft()
+        return {
+            "draft": text,
+            "attachments": attachments,
+            "scroll_anchor": self._message_view.get_scroll_anchor()
+        }
+
+    def restore_snapshot(self, snapshot: dict):
+        """
+        Restore the state of a hibernated context, must be called before
+        the history is loaded.
+
+        param:
+            snapshot: dict from `get_snapshot`
+        """
+        self._message_entry_bar.restore_draft(snapshot["draft"], snapshot["attachments"])
+        self._restore_anchor = snapshot["scroll_anchor"]
 
     def scroll_messages_to_bottom(self):
         """
@@ -219,6 +254,20 @@ class ChannelInnerWindow(Gtk.Box):
         self._popout_button_stack.set_visible_child(self._popin_button)
         self.is_poped = True
 
+    def teardown(self):
+        """
+        Stop everything the context does in the background, for example
+        downloads of its messages. Call this when closing it for good.
+
+        NOTE: use the close_inner_window_context of your application instead
+        """
+        if self.empty:
+            return
+        if self.is_poped:
+            self.popin()
+        self._message_view.teardown()
+        self._message_entry_bar.teardown()
+
     def do_first_see(self):
         """
         Do actions for when switched to/displayed.
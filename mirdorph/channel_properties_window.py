@@ -13,12 +13,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import asyncio
 import datetime
-import threading
 import discord
-from gi.repository import Adw, Gtk, Gio, GLib, Gdk
+from gi.repository import Adw, Gtk, Gio, Gdk
 from .event_receiver import EventReceiver
+from .scheduler import run_on_discord
 
 @Gtk.Template(resource_path="/org/gnome/gitlab/ranchester/Mirdorph/ui/channel_properties_window.ui")
 class ChannelPropertiesWindow(Adw.Window):
@@ -46,20 +45,15 @@ class ChannelPropertiesWindow(Adw.Window):
         else:
             self._description_label.hide()
 
-        threading.Thread(target=self._get_last_activity_time_target).start()
+        run_on_discord(
+            self._get_last_activity_time_async_target(self._channel_disc),
+            callback=self._set_last_activity_gtk_target
+        )
 
     async def _get_last_activity_time_async_target(self, channel: discord.TextChannel) -> datetime.datetime:
         async for message in channel.history(limit=1):
             return message.created_at
 
-    def _get_last_activity_time_target(self):
-        last_activity_time = asyncio.run_coroutine_threadsafe(
-            self._get_last_activity_time_async_target(self._channel_disc),
-            self.app.discord_loop
-        ).result()
-
-        GLib.idle_add(self._set_last_activity_gtk_target, last_activity_time)
-
     def _set_last_activity_gtk_target(self, time: datetime.datetime):
         readable_time = time.strftime("%a. %dd. %Hh. %Mm.")
         self._last_activity_button.set_label(readable_time)
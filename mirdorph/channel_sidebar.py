@@ -14,12 +14,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import asyncio
-import threading
 import logging
 import discord
 import os
 from pathlib import Path
-from gi.repository import Adw, Gtk, Gio, GObject, GLib, GdkPixbuf
+from gi.repository import Adw, Gtk, Gio, GObject, GdkPixbuf
+from .scheduler import run_on_discord
 
 # Use this to filter out only text channels, which we support
 TEXT_CHANNEL_FILTER = (discord.VoiceChannel, discord.StageChannel, discord.CategoryChannel)
@@ -69,9 +69,12 @@ class MirdorphGuildEntry(Adw.ExpanderRow):
         self.channel_listbox = Gtk.ListBox(show_separators=True)
         self.add(self.channel_listbox)
 
-        threading.Thread(
-            target=self._fetching_guild_threaded_target
-        ).start()
+        # Originally this was also for the guild itself, however now
+        # just for the image
+        run_on_discord(
+            self._save_guild_icon(self._disc_guild.icon_url_as(size=4096, format="png")),
+            callback=lambda _ : self._build_guild_gtk_target()
+        )
 
     @staticmethod
     def _get_icon_path_from_guild_id(guild_id: int) -> Path:
@@ -85,19 +88,6 @@ class MirdorphGuildEntry(Adw.ExpanderRow):
         except discord.errors.DiscordException:
             logging.warning("guild does not have icon, not saving")
 
-    def _fetching_guild_threaded_target(self):
-        # Originally this was also for the guild itself, however now
-        # just for the image
-        icon_asset = self._disc_guild.icon_url_as(size=4096, format="png")
-        asyncio.run_coroutine_threadsafe(
-            self._save_guild_icon(
-                icon_asset
-            ),
-            self.app.discord_loop
-        ).result()
-
-        GLib.idle_add(self._build_guild_gtk_target)
-
     def _build_guild_gtk_target(self):
         guild_image_path = self._get_icon_path_from_guild_id(self._disc_guild.id)
         guild_avatar = Adw.Avatar(size=32, show_initials=True)
@@ -159,7 +149,7 @@ class MirdorphChannelSidebar(Gtk.Box):
 
         self._guild_list_search_bar.connect_entry(self._guild_list_search_entry)
 
-        threading.Thread(target=self._build_guilds_target).start()
+        run_on_discord(self._get_guilds_list(), callback=self._build_guilds_gtk_target)
 
     def _select_default_search_row(self):
         """
@@ -223,14 +213,6 @@ class MirdorphChannelSidebar(Gtk.Box):
 
         return self.app.discord_client.guilds
 
-    def _build_guilds_target(self):
-        guilds = asyncio.run_coroutine_threadsafe(
-            self._get_guilds_list(),
-            self.app.discord_loop
-        ).result()
-
-        GLib.idle_add(self._build_guilds_gtk_target, guilds)
-
     def _build_guilds_gtk_target(self, guilds: list):
         for guild in guilds:
             guild_entry = MirdorphGuildEntry(guild)
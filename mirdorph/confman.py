@@ -42,6 +42,17 @@ class ConfManager(GObject.GObject):
         "tos_notice_accepted": False,
         "send_typing_events": True,
         "preview_links": True,
+        # Messages kept loaded in a channel, when scrolling further the ones
+        # furthest away are dropped, and loaded again when scrolling back.
+        "max_loaded_messages": 600,
+        # Channels kept open in the background, the least recently shown
+        # ones are hibernated when there are more.
+        "max_live_channels": 8,
+        # Most recently opened channels first, see ChannelWarmup
+        "recent_channels": [],
+        # How many of the recent channels are loaded in the background
+        # after connecting
+        "warm_up_channels": 5,
         "enabled_extensions": [
             "login_method_graphical",
             "login_method_password"
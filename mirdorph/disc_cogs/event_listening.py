@@ -13,297 +13,161 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
 import gi
 gi.require_version("Gtk", "4.0")
-from gi.repository import Gtk, Gio, GLib
+from gi.repository import Gtk, Gio
 import discord
 from discord.ext import commands
+from mirdorph.event_bridge import EventBridge
+from mirdorph.event_recording import EventRecorder
+
+# Events that can be forwarded to event receivers. Listeners for them are only
+# installed while a receiver is subscribed, otherwise for example every single
+# websocket frame (on_socket_raw_receive) would be forwarded for nothing.
+# on_ready is not here as it is always needed, see below.
+FORWARDED_EVENTS = (
+    "on_connect",
+    "on_shard_connect",
+    "on_disconnect",
+    "on_shard_disconnect",
+    "on_shard_ready",
+    "on_resumed",
+    "on_shard_resumed",
+    "on_error",
+    "on_socket_raw_receive",
+    "on_socket_raw_send",
+    "on_typing",
+    "on_message",
+    "on_message_delete",
+    "on_bulk_message_delete",
+    "on_raw_message_delete",
+    "on_raw_bulk_message_delete",
+    "on_message_edit",
+    "on_raw_message_edit",
+    "on_reaction_add",
+    "on_raw_reaction_add",
+    "on_reaction_remove",
+    "on_raw_reaction_remove",
+    "on_reaction_clear",
+    "on_raw_reaction_clear",
+    "on_reaction_clear_emoji",
+    "on_raw_reaction_clear_emoji",
+    "on_private_channel_delete",
+    "on_private_channel_create",
+    "on_private_channel_update",
+    "on_private_channel_pins_update",
+    "on_guild_channel_delete",
+    "on_guild_channel_create",
+    "on_guild_channel_update",
+    "on_guild_channel_pins_update",
+    "on_guild_integrations_update",
+    "on_webhooks_update",
+    "on_member_join",
+    "on_member_remove",
+    "on_member_update",
+    "on_user_update",
+    "on_guild_join",
+    "on_guild_remove",
+    "on_guild_update",
+    "on_guild_role_create",
+    "on_guild_role_delete",
+    "on_guild_role_update",
+    "on_guild_emojis_update",
+    "on_guild_available",
+    "on_guild_unavailable",
+    "on_voice_state_update",
+    "on_member_ban",
+    "on_member_unban",
+    "on_invite_create",
+    "on_invite_delete",
+    "on_group_join",
+    "on_group_remove",
+    "on_relationship_add",
+    "on_relationship_remove",
+    "on_relationship_update"
+)
 
 
 class EventListeningDispatcher(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Events are collected here from the discord loop and dispatched in
+        # batches on the GTK main loop. Public for debugging statistics.
+        self.bridge = EventBridge(self.forward_event, self._get_open_channels)
+
+        # Only when MIRDORPH_RECORD_EVENTS is set, for tests/replay_events.py
+        self.recorder = EventRecorder.from_environment()
+
+        # Event name -> listener coroutine, only for the ones currently installed
+        self._installed_listeners = {}
 
         # On ready is a useful event, but doesn't work with commands.Cog.listenr,
         # you need client.event instead.
         @self.bot.event
         async def on_ready(*args, **kwargs):
-            GLib.idle_add(self.forward_event, "on_ready", *args, **kwargs)
+            event_manager = getattr(Gio.Application.get_default(), "event_manager", None)
+            if event_manager is not None:
+                event_manager.dispatch_async_event("on_ready", *args, **kwargs)
+            self.bridge.push("on_ready", args, kwargs)
 
-    def forward_event(self, name, *args, **kwargs):
+    def forward_event(self, name: str, args: tuple, kwargs: dict, enqueued_at: float):
         app = Gio.Application.get_default()
+        if self.recorder is not None:
+            self.recorder.record(name, args, kwargs, enqueued_at)
+        if app.event_manager.stats.enabled:
+            app.event_manager.stats.record_latency(name, time.monotonic() - enqueued_at)
         app.event_manager.dispatch_event(name, *args, **kwargs)
 
-    # Could be minimized with exec(), but that would be insane
-
-    @commands.Cog.listener()
-    async def on_connect(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_connect", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_shard_connect(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_shard_connect", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_disconnect(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_disconnect", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_shard_disconnect(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_shard_disconnect", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_ready(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_ready", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_shard_ready(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_shard_ready", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_resumed(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_resumed", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_shard_resumed(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_shard_resumed", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_error(self, event, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_error", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_socket_raw_receive(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_socket_raw_receive", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_socket_raw_send(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_socket_raw_send", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_typing(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_typing", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_message(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_message", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_message_delete(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_message_delete", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_bulk_message_delete(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_bulk_message_delete", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_raw_message_delete(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_raw_message_delete", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_message_edit(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_message_edit", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_raw_message_edit(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_raw_message_edit", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_reaction_add(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_reaction_add", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_raw_reaction_add(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_raw_reaction_add", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_reaction_remove(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_reaction_remove", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_raw_reaction_remove(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_raw_reaction_remove", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_reaction_clear(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_reaction_clear", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_raw_reaction_clear(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_raw_reaction_clear", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_reaction_clear_emoji(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_reaction_clear_emoji", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_raw_reaction_clear_emoji(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_raw_reaction_clear_emoji", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_private_channel_delete(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_private_channel_delete", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_private_channel_create(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_private_channel_create", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_private_channel_update(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_private_channel_update", *args, **kwargs)
+    def _create_listener(self, name: str):
+        event_manager = Gio.Application.get_default().event_manager
 
-    @commands.Cog.listener()
-    async def on_private_channel_pins_update(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_private_channel_pins_update", *args, **kwargs)
+        async def listener(*args, **kwargs):
+            # Coroutine handlers run right here, without going through GTK
+            if name in event_manager.get_async_subscribed_events():
+                event_manager.dispatch_async_event(name, *args, **kwargs)
+            if name in event_manager.get_sync_subscribed_events():
+                self.bridge.push(name, args, kwargs)
+        return listener
 
-    @commands.Cog.listener()
-    async def on_guild_channel_delete(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_guild_channel_delete", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_guild_channel_create(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_guild_channel_create", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_guild_channel_update(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_guild_channel_update", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_guild_channel_pins_update(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_guild_channel_pins_update", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_guild_integrations_update(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_guild_integrations_update", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_webhooks_update(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_webhooks_update", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_member_join(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_member_join", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_member_remove(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_member_remove", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_member_update(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_member_update", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_user_update(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_user_update", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_guild_join(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_guild_join", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_guild_remove(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_guild_remove", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_guild_update(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_guild_update", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_guild_role_create(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_guild_role_create", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_guild_role_delete(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_guild_role_delete", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_guild_role_update(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_guild_role_update", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_guild_emojis_update(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_guild_emojis_update", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_guild_available(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_guild_available", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_guild_unavailable(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_guild_unavailable", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_voice_state_update(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_voice_state_update", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_member_ban(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_member_ban", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_member_unban(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_member_unban", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_invite_create(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_invite_create", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_invite_delete(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_invite_delete", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_group_join(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_group_join", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_group_remove(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event, "on_group_remove", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_relationship_add(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_relationship_add", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_relationship_remove(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_relationship_remove", *args, **kwargs)
-
-    @commands.Cog.listener()
-    async def on_relationship_update(self, *args, **kwargs):
-        GLib.idle_add(self.forward_event,
-                      "on_relationship_update", *args, **kwargs)
+    def _get_wanted_events(self) -> frozenset:
+        app = Gio.Application.get_default()
+        # The application is created in parallel on the GTK thread,
+        # once it gets an event manager it requests a sync itself.
+        event_manager = getattr(app, "event_manager", None)
+        if event_manager is None:
+            return frozenset()
+        return event_manager.get_subscribed_events()
+
+    def _get_open_channels(self) -> frozenset:
+        app = Gio.Application.get_default()
+        event_manager = getattr(app, "event_manager", None)
+        if event_manager is None:
+            return frozenset()
+        return event_manager.get_subscribed_channels()
+
+    def _sync_listeners(self):
+        wanted_events = self._get_wanted_events()
+        for name in FORWARDED_EVENTS:
+            if name in wanted_events and name not in self._installed_listeners:
+                listener = self._create_listener(name)
+                self.bot.add_listener(listener, name)
+                self._installed_listeners[name] = listener
+            elif name not in wanted_events and name in self._installed_listeners:
+                self.bot.remove_listener(self._installed_listeners.pop(name), name)
+
+    def request_listener_sync(self):
+        """
+        Install and remove the discord.py listeners so that only events that
+        have a subscribed event receiver are forwarded.
+
+        This is safe to call from any thread, the actual sync happens on the
+        discord loop.
+        """
+        self.bot.loop.call_soon_threadsafe(self._sync_listeners)
 
 
 def setup(bot: commands.Bot):
-    bot.add_cog(EventListeningDispatcher(bot))
+    dispatcher = EventListeningDispatcher(bot)
+    bot.add_cog(dispatcher)
+    dispatcher.request_listener_sync()
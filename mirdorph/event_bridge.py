@@ -0,0 +1,382 @@
+# Copyright 2021 Raidro Manchester
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import logging
+import threading
+import time
+from enum import Enum
+from gi.repository import Gio, GLib
+from .event_manager import get_event_channel_id
+
+
+def _merge_update_event(old_args: tuple, new_args: tuple) -> tuple:
+    # (before, after) events, the receiver should see the whole change
+    return (old_args[0],) + new_args[1:]
+
+
+def _merge_keep_latest(old_args: tuple, new_args: tuple) -> tuple:
+    return new_args
+
+
+# High volume events that often arrive many times for the same thing before
+# the main thread gets to them. Event name -> (function getting the key of the
+# entity from the event arguments, function merging the arguments of the queued
+# event with the new one). Presence changes are also on_member_update.
+COALESCED_EVENTS = {
+    "on_member_update": (
+        lambda before, after : (after.guild.id, after.id),
+        _merge_update_event
+    ),
+    "on_user_update": (
+        lambda before, after : after.id,
+        _merge_update_event
+    ),
+    "on_guild_update": (
+        lambda before, after : after.id,
+        _merge_update_event
+    ),
+    "on_guild_role_update": (
+        lambda before, after : after.id,
+        _merge_update_event
+    ),
+    "on_typing": (
+        lambda channel, user, when : (channel.id, user.id),
+        _merge_keep_latest
+    )
+}
+
+# Events after which a queued event of COALESCED_EVENTS can't be merged with
+# newer ones anymore, as that would move the newer one before them. A typing
+# event merged into one before a message of the same user would be dispatched
+# before that message, which ends the typing. Event name -> function getting
+# the coalescing key (as in _QueuedEvent.key) from the event arguments.
+COALESCING_BARRIERS = {
+    "on_message": lambda message : ("on_typing", (message.channel.id, message.author.id))
+}
+
+# Events that go into the priority lane when they are for a channel that is open
+PRIORITY_EVENTS = frozenset((
+    "on_message",
+    "on_message_edit",
+    "on_raw_message_edit",
+    "on_message_delete",
+    "on_raw_message_delete",
+    "on_bulk_message_delete",
+    "on_raw_bulk_message_delete",
+    "on_typing"
+))
+
+# Not a discord event, dispatched when events of a lane had to be thrown
+# away, receivers should then fetch the current state themselves.
+RESYNC_EVENT = "on_resync_needed"
+
+# Events that are never shed, even over the capacity of their lane. They are
+# rare, and what they change (the guilds and channels in the sidebar, the
+# connection) can't be fetched again by receivers of RESYNC_EVENT.
+UNSHEDDABLE_EVENTS = frozenset((
+    "on_connect",
+    "on_disconnect",
+    "on_ready",
+    "on_resumed",
+    "on_guild_join",
+    "on_guild_remove",
+    "on_guild_available",
+    "on_guild_unavailable",
+    "on_guild_channel_create",
+    "on_guild_channel_delete",
+    "on_guild_channel_update",
+    "on_guild_role_create",
+    "on_guild_role_delete",
+    "on_member_join",
+    "on_member_remove",
+    "on_private_channel_create",
+    "on_private_channel_delete"
+))
+
+
+class OverloadPolicy(Enum):
+    # New events that don't fit are merged into a queued event for the same
+    # entity (see COALESCED_EVENTS), others are dropped and a RESYNC_EVENT
+    # is queued once, as receivers can't know what they missed.
+    COALESCE = 0
+    # The whole lane is thrown away and replaced by a single RESYNC_EVENT
+    RESYNC = 1
+
+
+class _QueuedEvent:
+    __slots__ = ("name", "args", "kwargs", "key", "queued", "enqueued_at")
+
+    def __init__(self, name: str, args: tuple, kwargs: dict, key=None):
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        # Coalescing key, see COALESCED_EVENTS
+        self.key = key
+        self.queued = True
+        # time.monotonic() of when it was queued, if merged with newer events,
+        # this stays the time of the first one.
+        self.enqueued_at = time.monotonic()
+
+
+class EventLane:
+    """
+    A bounded queue of the event bridge.
+
+    attributes:
+        name: `str` name of the lane, for debugging
+        capacity: `int` how many events can be waiting at most
+        policy: `OverloadPolicy` what happens to events when it is full
+        shed_count: `int` how many events were lost to overload
+    """
+    def __init__(self, name: str, capacity: int, policy: OverloadPolicy):
+        self.name = name
+        self.capacity = capacity
+        self.policy = policy
+        self.shed_count = 0
+        self.queue = collections.deque()
+        # Event name -> newest queued event with it
+        self.newest_by_name = {}
+        # If currently shedding load, used to only warn once per overload
+        self.overloaded = False
+
+
+class EventBridge:
+    """
+    Moves gateway events from the discord thread to the GTK main loop.
+
+    Instead of a GLib.idle_add for every event (which floods the main context
+    with thousands of sources during READY or a raid), events are put in a
+    queue that is drained by a single idle source. Every run of the source
+    only dispatches events for a part of a frame, so that drawing, scrolling
+    and typing still happen while a burst is being handled.
+
+    Events of `COALESCED_EVENTS` that are still waiting in the queue are merged
+    with newer ones for the same entity, so only the latest state is dispatched,
+    unless an event of `COALESCING_BARRIERS` was queued after them.
+
+    The queue is split into two bounded lanes: the priority lane for message
+    events of open channels that is always handled first, and the default lane
+    for everything else. When the main thread can't keep up, lanes shed load
+    according to their `OverloadPolicy`.
+
+    attributes:
+        coalesced_count: how many events were merged into already queued ones
+        resync_count: how many times a lane had to queue a resync
+        priority_lane: `EventLane` for events in open channels
+        default_lane: `EventLane` for everything else
+    """
+    # Part of a frame (based on the frame clock of the window) that dispatching
+    # events may take up.
+    _FRAME_BUDGET_FRACTION = 0.5
+    # Used when there is no window with a frame clock, for example when still
+    # starting up, in seconds.
+    _DEFAULT_FRAME_BUDGET = 0.008
+    # How many events to take from the queue at once
+    _BATCH_SIZE = 64
+
+    def __init__(self, dispatch_func, get_open_channels=None):
+        """
+        Create an EventBridge.
+
+        param:
+            dispatch_func: called on the main thread for every event with
+            (name, args, kwargs, enqueued_at), where enqueued_at is the
+            time.monotonic() of when the event was queued
+            get_open_channels: optional, called from the pushing thread to get
+            a set of channel ids that have their events in the priority lane
+        """
+        self._dispatch_func = dispatch_func
+        self._get_open_channels = get_open_channels
+        self._lock = threading.Lock()
+        self.priority_lane = EventLane("priority", 2000, OverloadPolicy.RESYNC)
+        self.default_lane = EventLane("default", 10000, OverloadPolicy.COALESCE)
+        # In order of priority
+        self._lanes = (self.priority_lane, self.default_lane)
+        # (name, coalescing key) -> queued event
+        self._pending_by_key = {}
+        self._drain_scheduled = False
+        self.coalesced_count = 0
+        self.resync_count = 0
+
+    @property
+    def shed_count(self) -> int:
+        """
+        How many events were dropped, replaced or resynced away
+        because of overload in total.
+        """
+        return sum(lane.shed_count for lane in self._lanes)
+
+    def _choose_lane(self, name: str, args: tuple, kwargs: dict) -> EventLane:
+        if name in PRIORITY_EVENTS and self._get_open_channels is not None:
+            if get_event_channel_id(name, *args, **kwargs) in self._get_open_channels():
+                return self.priority_lane
+        return self.default_lane
+
+    def _append(self, lane: EventLane, event: _QueuedEvent):
+        lane.queue.append(event)
+        lane.newest_by_name[event.name] = event
+        if event.key is not None:
+            self._pending_by_key[event.key] = event
+
+    def _unqueue(self, event: _QueuedEvent):
+        """
+        Mark an event that was taken out of its lane as no longer queued.
+        """
+        event.queued = False
+        if event.key is not None and self._pending_by_key.get(event.key) is event:
+            del self._pending_by_key[event.key]
+
+    def _shed(self, lane: EventLane, event: _QueuedEvent):
+        """
+        Handle an event that doesn't fit into its lane anymore.
+        """
+        lane.shed_count += 1
+        if not lane.overloaded:
+            lane.overloaded = True
+            logging.warning(f"event bridge {lane.name} lane overloaded, shedding events ({lane.policy})")
+
+        if lane.policy == OverloadPolicy.COALESCE:
+            # Events with a queued one for the same entity were already merged
+            # in push(). Replacing one of another entity would mix up their
+            # arguments, and events like on_member_join can't be repeated
+            # anyways, so the event is lost and receivers have to resync.
+            resync = lane.newest_by_name.get(RESYNC_EVENT)
+            if resync is None or not resync.queued:
+                self.resync_count += 1
+                # Over the capacity, but only ever this one event
+                self._append(lane, _QueuedEvent(RESYNC_EVENT, (), {}))
+        elif lane.policy == OverloadPolicy.RESYNC:
+            for queued_event in lane.queue:
+                self._unqueue(queued_event)
+            lane.queue.clear()
+            lane.newest_by_name.clear()
+            self.resync_count += 1
+            # Receivers will fetch the state anyway, so nothing else is needed
+            # in the lane until the resync has been dispatched.
+            self._append(lane, _QueuedEvent(RESYNC_EVENT, (), {}))
+
+    def push(self, name: str, args: tuple, kwargs: dict):
+        """
+        Queue an event to be dispatched on the main thread,
+        this is safe to call from any thread.
+
+        param:
+            name: the name of the event, for example "on_message"
+            args: the positional arguments of the event
+            kwargs: the keyword arguments of the event
+        """
+        key = None
+        if name in COALESCED_EVENTS and not kwargs:
+            get_key, merge_args = COALESCED_EVENTS[name]
+            key = (name, get_key(*args))
+        lane = self._choose_lane(name, args, kwargs)
+
+        with self._lock:
+            # Usually nothing is waiting to be merged at all
+            if name in COALESCING_BARRIERS and self._pending_by_key:
+                barred = self._pending_by_key.pop(COALESCING_BARRIERS[name](*args), None)
+                if barred is not None:
+                    # Stays queued, but newer events are queued after this one
+                    barred.key = None
+            if key is not None and key in self._pending_by_key:
+                event = self._pending_by_key[key]
+                event.args = merge_args(event.args, args)
+                self.coalesced_count += 1
+                return
+
+            event = _QueuedEvent(name, args, kwargs, key)
+            if len(lane.queue) >= lane.capacity and name not in UNSHEDDABLE_EVENTS:
+                self._shed(lane, event)
+            else:
+                self._append(lane, event)
+
+            if self._drain_scheduled:
+                return
+            self._drain_scheduled = True
+        GLib.idle_add(self._drain)
+
+    def _get_frame_budget(self) -> float:
+        """
+        Get how long (in seconds) a single drain may take.
+        """
+        app = Gio.Application.get_default()
+        window = app.get_active_window() if app else None
+        clock = window.get_frame_clock() if window else None
+        if clock:
+            fps = clock.get_fps()
+            if fps > 0:
+                return self._FRAME_BUDGET_FRACTION / fps
+        return self._DEFAULT_FRAME_BUDGET
+
+    def _take_batch(self) -> tuple:
+        """
+        Take the next events out of the most important lane that has any.
+
+        NOTE: the lock must be held
+
+        returns:
+            tuple of (the lane, list of `_QueuedEvent`), the list is empty
+            if there are no events at all
+        """
+        for lane in self._lanes:
+            if lane.queue:
+                batch = [
+                    lane.queue.popleft()
+                    for _ in range(min(self._BATCH_SIZE, len(lane.queue)))
+                ]
+                # Once taken out, new events can't be merged into them anymore
+                for event in batch:
+                    self._unqueue(event)
+                if not lane.queue:
+                    lane.newest_by_name.clear()
+                    lane.overloaded = False
+                return lane, batch
+        return None, []
+
+    def _put_back(self, lane: EventLane, events: list):
+        """
+        Put events that were taken but not dispatched back to the front of their lane.
+
+        NOTE: the lock must be held
+        """
+        lane.queue.extendleft(reversed(events))
+        for event in events:
+            event.queued = True
+            lane.newest_by_name.setdefault(event.name, event)
+            if event.key is not None:
+                self._pending_by_key.setdefault(event.key, event)
+
+    def _drain(self):
+        deadline = time.monotonic() + self._get_frame_budget()
+        while True:
+            with self._lock:
+                lane, batch = self._take_batch()
+                if not batch:
+                    self._drain_scheduled = False
+                    return GLib.SOURCE_REMOVE
+
+            for i, event in enumerate(batch):
+                try:
+                    self._dispatch_func(event.name, event.args, event.kwargs, event.enqueued_at)
+                except Exception:
+                    logging.exception(f"error while dispatching {event.name}")
+
+                if time.monotonic() >= deadline:
+                    # The rest are handled in the next run, after GTK had
+                    # the chance to draw a frame.
+                    with self._lock:
+                        self._put_back(lane, batch[i + 1:])
+                    return GLib.SOURCE_CONTINUE
@@ -13,34 +13,384 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
+import functools
 import logging
+import os
+import time
+import weakref
 from .event_receiver import EventReceiver
+from .event_stats import EventStats
 from gi.repository import Gio, Gtk
 
+
+# Events that belong to a specific channel, with how to get the channel id from
+# the arguments of the event. Receivers that are only interested in one channel
+# get these events only for it.
+CHANNEL_EVENTS = {
+    "on_typing": lambda channel, *args : channel.id,
+    "on_message": lambda message : message.channel.id,
+    "on_message_delete": lambda message : message.channel.id,
+    "on_bulk_message_delete": lambda messages : messages[0].channel.id,
+    "on_raw_message_delete": lambda payload : payload.channel_id,
+    "on_raw_bulk_message_delete": lambda payload : payload.channel_id,
+    "on_message_edit": lambda before, after : after.channel.id,
+    "on_raw_message_edit": lambda payload : payload.channel_id,
+    "on_reaction_add": lambda reaction, user : reaction.message.channel.id,
+    "on_raw_reaction_add": lambda payload : payload.channel_id,
+    "on_reaction_remove": lambda reaction, user : reaction.message.channel.id,
+    "on_raw_reaction_remove": lambda payload : payload.channel_id,
+    "on_reaction_clear": lambda message, reactions : message.channel.id,
+    "on_raw_reaction_clear": lambda payload : payload.channel_id,
+    "on_reaction_clear_emoji": lambda reaction : reaction.message.channel.id,
+    "on_raw_reaction_clear_emoji": lambda payload : payload.channel_id
+}
+
+
+def get_event_channel_id(name: str, *args, **kwargs) -> int:
+    """
+    Get the id of the channel an event belongs to.
+
+    param:
+        name: the name of the event, for example "on_message"
+        args, kwargs: the arguments of the event
+    returns:
+        the channel id, or None if the event isn't specific to a channel
+    """
+    if name not in CHANNEL_EVENTS:
+        return None
+    return CHANNEL_EVENTS[name](*args, **kwargs)
+
+
 class EventManager:
     """
     Manages events and event receivers
 
     You need your application to have one as .event_manager
     for the event receivers to register against.
+
+    Receivers are only weakly referenced, once nothing else uses them
+    they stop receiving events and are removed automatically.
+
+    Handlers that are coroutines (async def disc_*) are not run on the GTK
+    thread, but directly on the discord loop with `dispatch_async_event`.
+
+    attributes:
+        stats: `EventStats` of the dispatched events, only collected when
+        the MIRDORPH_EVENT_STATS environment variable is set
     """
     def __init__(self):
         self.app = Gio.Application.get_default()
-        self._receivers = []
+        self.stats = EventStats(enabled=bool(os.environ.get("MIRDORPH_EVENT_STATS")))
+        # id(receiver) -> (weakref to the receiver, events it handles,
+        # events it handles with coroutines, its channel id)
+        self._receivers = {}
+        # Event name -> {id(receiver): weakref} of receivers that actually implement
+        # a handler for it. Most receivers only care about one or two events, and
+        # looking up (and calling) the no-op stubs for every single gateway event
+        # gets very expensive in big guilds.
+        self._subscriptions = {}
+        # Event name -> channel id -> {id(receiver): weakref}, for CHANNEL_EVENTS
+        # of receivers that only care about a single channel. Contexts for example
+        # would otherwise get every message of every guild just to ignore it.
+        self._channel_subscriptions = {}
+        # Event name -> {id(receiver): (weakref, channel id)} for coroutine handlers
+        self._async_subscriptions = {}
+        # Event name -> tuple of (weakref, channel id), a copy of _async_subscriptions
+        # for the discord thread. Always replaced, never modified.
+        self._async_handlers = {}
+        # Running tasks of coroutine handlers, only used on the discord thread
+        self._async_handler_tasks = set()
+        # Names of all events that have at least one subscriber, and split by
+        # the kind of handler. Always replaced, never modified, so that they can
+        # be read from the discord thread.
+        self._subscribed_events = frozenset()
+        self._sync_subscribed_events = frozenset()
+        self._async_subscribed_events = frozenset()
+        # Ids of channels that have a channel specific receiver (are open),
+        # also readable from the discord thread.
+        self._subscribed_channels = frozenset()
+        # Receiver class -> (tuple of event names it overrides with normal functions,
+        # tuple of ones it overrides with coroutines), the class doesn't
+        # change after creation so there is no need to inspect it every time.
+        self._class_events_cache = {}
+        # Weakref callbacks can run on any thread, in the middle of anything (GC),
+        # so they only note the receiver here and the actual removal is done later.
+        self._dead_receivers = []
+
+    def _get_handled_events(self, receiver: EventReceiver) -> tuple:
+        """
+        Get the names of the events (without the "disc_" prefix) that a receiver
+        implements itself, instead of inheriting the no-op stub from `EventReceiver`.
+
+        param:
+            receiver: the receiver to inspect
+        returns:
+            tuple of (tuple of `str` event names handled by normal functions,
+            for example ("on_message",), tuple of the ones handled by coroutines)
+        """
+        receiver_class = type(receiver)
+        if receiver_class not in self._class_events_cache:
+            handled_events = []
+            async_handled_events = []
+            for attr_name in dir(receiver_class):
+                if not attr_name.startswith("disc_"):
+                    continue
+                handler = getattr(receiver_class, attr_name)
+                if not callable(handler):
+                    continue
+                if handler is getattr(EventReceiver, attr_name, None):
+                    continue
+                if asyncio.iscoroutinefunction(handler):
+                    async_handled_events.append(attr_name[len("disc_"):])
+                else:
+                    handled_events.append(attr_name[len("disc_"):])
+            self._class_events_cache[receiver_class] = (
+                tuple(handled_events),
+                tuple(async_handled_events)
+            )
+
+        return self._class_events_cache[receiver_class]
 
-    def register_receiver(self, receiver: EventReceiver):
+    def _purge_dead_receivers(self):
+        while self._dead_receivers:
+            key = self._dead_receivers.pop()
+            # The id may already belong to a new receiver
+            if key in self._receivers and self._receivers[key][0]() is None:
+                self._remove_receiver_key(key)
+
+    def _remove_receiver_key(self, key: int):
+        try:
+            _, events, async_events, channel_id = self._receivers.pop(key)
+        except KeyError:
+            return
+
+        for name in events:
+            if channel_id is not None and name in CHANNEL_EVENTS:
+                channels = self._channel_subscriptions[name]
+                subscribers = channels[channel_id]
+                del subscribers[key]
+                if not subscribers:
+                    del channels[channel_id]
+                if not channels:
+                    del self._channel_subscriptions[name]
+            else:
+                subscribers = self._subscriptions[name]
+                del subscribers[key]
+                if not subscribers:
+                    del self._subscriptions[name]
+        for name in async_events:
+            subscribers = self._async_subscriptions[name]
+            del subscribers[key]
+            if not subscribers:
+                del self._async_subscriptions[name]
+        if async_events:
+            self._update_async_handlers()
+        if events or async_events:
+            self._update_subscribed_events()
+
+    def _update_async_handlers(self):
+        self._async_handlers = {
+            name: tuple(subscribers.values())
+            for name, subscribers in self._async_subscriptions.items()
+        }
+
+    def _update_subscribed_events(self):
+        self._subscribed_channels = frozenset(
+            channel_id
+            for channels in self._channel_subscriptions.values()
+            for channel_id in channels
+        )
+
+        self._sync_subscribed_events = frozenset(self._subscriptions).union(
+            self._channel_subscriptions
+        )
+        self._async_subscribed_events = frozenset(self._async_subscriptions)
+        subscribed_events = self._sync_subscribed_events.union(self._async_subscribed_events)
+        if subscribed_events == self._subscribed_events:
+            return
+        self._subscribed_events = subscribed_events
+
+        # Gateway events nobody listens to shouldn't even be forwarded
+        # to the main thread, so the listener cog has to know.
+        app = Gio.Application.get_default()
+        discord_client = getattr(app, "discord_client", None)
+        if discord_client is None:
+            return
+        dispatcher = discord_client.get_cog("EventListeningDispatcher")
+        if dispatcher is not None:
+            dispatcher.request_listener_sync()
+
+    def register_receiver(self, receiver: EventReceiver, channel_id: int = None):
         """
         Register a receiver
 
+        NOTE: only a weak reference is kept, you need to keep the receiver
+        alive yourself for as long as it should receive events.
+
         param:
             receiver: the receiver object that will now receive e
                 NOTE: usually users don't use this as the EventReceiver __init__
                 does it
+            channel_id: if set, events of `CHANNEL_EVENTS` are only received
+            for this channel, other events are not affected
         """
-        self._receivers.append(receiver)
+        self._purge_dead_receivers()
+        key = id(receiver)
+        if key in self._receivers:
+            return
+
+        receiver_ref = weakref.ref(
+            receiver,
+            lambda ref : self._dead_receivers.append(key)
+        )
+        events, async_events = self._get_handled_events(receiver)
+        self._receivers[key] = (receiver_ref, events, async_events, channel_id)
+        for name in events:
+            if channel_id is not None and name in CHANNEL_EVENTS:
+                self._channel_subscriptions.setdefault(name, {}).setdefault(
+                    channel_id, {}
+                )[key] = receiver_ref
+            else:
+                self._subscriptions.setdefault(name, {})[key] = receiver_ref
+        for name in async_events:
+            self._async_subscriptions.setdefault(name, {})[key] = (receiver_ref, channel_id)
+        if async_events:
+            self._update_async_handlers()
+        if events or async_events:
+            self._update_subscribed_events()
+
+    def unregister_receiver(self, receiver: EventReceiver):
+        """
+        Unregister a receiver, it will no longer receive any events.
+
+        This happens automatically when the receiver is garbage collected,
+        however for example a context that is closed should do it explicitly.
+
+        param:
+            receiver: the receiver that should be removed, it is fine if it
+            isn't registered
+        """
+        self._purge_dead_receivers()
+        self._remove_receiver_key(id(receiver))
+
+    def get_n_receivers(self) -> int:
+        """
+        Get the number of receivers that are currently registered
+        """
+        self._purge_dead_receivers()
+        return len(self._receivers)
+
+    def get_subscribed_events(self) -> frozenset:
+        """
+        Get the names of all events that at least one receiver is subscribed to.
+
+        NOTE: unlike other methods, this one is safe to call from any thread.
+        Receivers that were garbage collected but not yet noticed may still
+        be counted.
+
+        returns:
+            `frozenset` of `str` event names
+        """
+        return self._subscribed_events
+
+    def get_sync_subscribed_events(self) -> frozenset:
+        """
+        Like `get_subscribed_events`, but only events with normal handlers,
+        which have to be dispatched on the GTK thread.
+        """
+        return self._sync_subscribed_events
+
+    def get_async_subscribed_events(self) -> frozenset:
+        """
+        Like `get_subscribed_events`, but only events with coroutine handlers,
+        which have to be dispatched on the discord loop.
+        """
+        return self._async_subscribed_events
+
+    def get_subscribed_channels(self) -> frozenset:
+        """
+        Get the ids of channels for which at least one receiver is subscribed
+        to channel specific events.
+
+        NOTE: like `get_subscribed_events`, this is safe to call from any thread.
+
+        returns:
+            `frozenset` of `int` channel ids
+        """
+        return self._subscribed_channels
+
+    def has_subscribers(self, name: str) -> bool:
+        """
+        Check if any receiver implements a handler for an event
+
+        param:
+            name: the name of the event, for example "on_message"
+        """
+        self._purge_dead_receivers()
+        return name in self._subscribed_events
 
     def dispatch_event(self, name: str, *args, **kwargs):
-        logging.info(f"re-dispatcihing event {name} to GLib")
-        for receiver in self._receivers:
+        self._purge_dead_receivers()
+        # Copied, as handlers are allowed to create new receivers while
+        # the event is being dispatched.
+        receiver_refs = tuple(self._subscriptions.get(name, {}).values())
+        if name in self._channel_subscriptions:
+            channel_id = get_event_channel_id(name, *args, **kwargs)
+            receiver_refs += tuple(
+                self._channel_subscriptions[name].get(channel_id, {}).values()
+            )
+
+        stats = self.stats
+        if stats.enabled:
+            stats.record_event(name)
+
+        for receiver_ref in receiver_refs:
+            receiver = receiver_ref()
+            if receiver is None:
+                continue
             func = getattr(receiver, ("disc_" + name))
-            func(*args, **kwargs)
+            if stats.enabled:
+                start_time = time.perf_counter()
+                func(*args, **kwargs)
+                stats.record_handler(receiver, name, time.perf_counter() - start_time)
+            else:
+                func(*args, **kwargs)
+
+    def _on_async_handler_done(self, name: str, task: asyncio.Task):
+        self._async_handler_tasks.discard(task)
+        if task.cancelled():
+            return
+        exception = task.exception()
+        if exception is not None:
+            logging.error(f"error in async handler for {name}", exc_info=exception)
+
+    def dispatch_async_event(self, name: str, *args, **kwargs):
+        """
+        Run the coroutine handlers of an event, each one as its own task.
+
+        NOTE: unlike the other methods, this one has to be called on the
+        discord loop.
+
+        param:
+            name: the name of the event, for example "on_message"
+            args, kwargs: the arguments of the event
+        """
+        handlers = self._async_handlers.get(name)
+        if not handlers:
+            return
+
+        event_channel_id = None
+        if name in CHANNEL_EVENTS:
+            event_channel_id = get_event_channel_id(name, *args, **kwargs)
+
+        for receiver_ref, channel_id in handlers:
+            receiver = receiver_ref()
+            if receiver is None:
+                continue
+            if channel_id is not None and name in CHANNEL_EVENTS and channel_id != event_channel_id:
+                continue
+            task = asyncio.ensure_future(getattr(receiver, "disc_" + name)(*args, **kwargs))
+            # The loop only keeps weak references to tasks
+            self._async_handler_tasks.add(task)
+            task.add_done_callback(functools.partial(self._on_async_handler_done, name))
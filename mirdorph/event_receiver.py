@@ -24,11 +24,23 @@ class EventReceiver:
     To use, subclass it and init it.
     Then on functions "disc_" + event name from documentation
     you can receive events and all the arguments
+
+    Handlers can also be coroutines (async def), those are run on the
+    discord loop instead of the GTK thread, so they can await discord.py
+    directly but must not touch widgets.
     """
     
-    def __init__(self):
+    def __init__(self, channel_id: int = None):
+        """
+        Start receiving events.
+
+        param:
+            channel_id: if the receiver is only interested in a single
+            channel, the id of it. Channel specific events (like messages
+            and typing) from other channels are then not received.
+        """
         self._ev_app = Gio.Application.get_default()
-        self._ev_app.event_manager.register_receiver(self)
+        self._ev_app.event_manager.register_receiver(self, channel_id=channel_id)
 
     def disc_on_ready(self, *args, **kwargs):
         pass
@@ -81,6 +93,9 @@ class EventReceiver:
     def disc_on_raw_message_delete(self, *args, **kwargs):
         pass
 
+    def disc_on_raw_bulk_message_delete(self, *args, **kwargs):
+        pass
+
     def disc_on_message_edit(self, *args, **kwargs):
         pass
 
@@ -209,3 +224,9 @@ class EventReceiver:
 
     def disc_on_relationship_update(self, *args, **kwargs):
         pass
+
+    # Not a discord event, received when the UI couldn't keep up with events
+    # and some of them were lost, for example messages, edits, deletes or typing
+    # events of open channels. You should fetch the current state again.
+    def disc_on_resync_needed(self, *args, **kwargs):
+        pass
@@ -0,0 +1,243 @@
+# Copyright 2021 Raidro Manchester
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import gzip
+import json
+import logging
+import os
+import time
+import zlib
+from pathlib import Path
+
+RECORDING_VERSION = 1
+
+# Attributes of discord.py objects that are saved. The objects themselves
+# can't be pickled (they reference the connection state), and saving everything
+# would make recordings huge, so only what receivers actually use is kept.
+RECORDED_ATTRIBUTES = (
+    "id",
+    "name",
+    "display_name",
+    "discriminator",
+    "bot",
+    "content",
+    "created_at",
+    "edited_at",
+    "pinned",
+    "channel",
+    "author",
+    "guild",
+    "me",
+    "message",
+    "attachments",
+    "mentions",
+    "emoji",
+    "count",
+    "channel_id",
+    "message_id",
+    "message_ids",
+    "guild_id",
+    "user_id",
+    "cached_message",
+    "cached_messages",
+    "data",
+    "filename",
+    "url",
+    "size",
+    "content_type"
+)
+
+# Objects nested deeper than this are only saved with their id, for example
+# message -> channel -> guild -> me is still complete, but not its guild again.
+_MAX_DEPTH = 3
+
+
+def encode_value(value, depth: int = 0):
+    """
+    Convert an event argument to something json serializable.
+
+    param:
+        value: the argument, usually a discord.py object
+        depth: how deeply nested in other objects the value is, for internal use
+    returns:
+        the json serializable representation, see `decode_value`
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [encode_value(item, depth) for item in value]
+    if isinstance(value, dict):
+        return {
+            "__dict__": {
+                str(key): encode_value(item, depth) for key, item in value.items()
+            }
+        }
+
+    attrs = {}
+    names = RECORDED_ATTRIBUTES if depth < _MAX_DEPTH else ("id",)
+    for name in names:
+        try:
+            attr = getattr(value, name)
+        except Exception:
+            # Many discord.py properties raise when their data isn't cached
+            continue
+        if callable(attr):
+            continue
+        attrs[name] = encode_value(attr, depth + 1)
+    return {"__object__": type(value).__name__, "attrs": attrs}
+
+
+class RecordedObject:
+    """
+    Stand-in for a discord.py object of a recording.
+
+    It has the recorded attributes of the original object, and like discord.py
+    objects compares and hashes by id.
+    """
+    def __init__(self, type_name: str, attrs: dict):
+        self.type_name = type_name
+        for name, attr in attrs.items():
+            setattr(self, name, attr)
+
+    def __eq__(self, other):
+        if not hasattr(self, "id"):
+            return self is other
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        if not hasattr(self, "id"):
+            return object.__hash__(self)
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"<Recorded{self.type_name} id={getattr(self, 'id', None)}>"
+
+    def __str__(self):
+        return str(getattr(self, "name", self.type_name))
+
+
+def decode_value(value):
+    """
+    Convert a value created by `encode_value` back,
+    discord.py objects become `RecordedObject`s.
+    """
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    if isinstance(value, dict):
+        if "__datetime__" in value:
+            return datetime.datetime.fromisoformat(value["__datetime__"])
+        if "__dict__" in value:
+            return {key: decode_value(item) for key, item in value["__dict__"].items()}
+        if "__object__" in value:
+            return RecordedObject(
+                value["__object__"],
+                {name: decode_value(attr) for name, attr in value["attrs"].items()}
+            )
+    return value
+
+
+class EventRecorder:
+    """
+    Records the events that reach the event manager to a gzip compressed
+    file of json lines, to be replayed with tests/replay_events.py.
+    """
+    def __init__(self, path: Path):
+        """
+        Create an EventRecorder and start a new recording.
+
+        param:
+            path: the file to record to, it is overwritten
+        """
+        self.path = Path(path)
+        self._fd = gzip.open(str(self.path), "wt")
+        self._start_time = time.monotonic()
+        self._write({"version": RECORDING_VERSION})
+        logging.info(f"recording events to {self.path}")
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Create a recorder if MIRDORPH_RECORD_EVENTS is set to a path.
+
+        returns:
+            the `EventRecorder`, or None if recording isn't enabled
+        """
+        path = os.environ.get("MIRDORPH_RECORD_EVENTS")
+        if not path:
+            return None
+        return cls(Path(path))
+
+    def _write(self, line: dict):
+        self._fd.write(json.dumps(line, separators=(",", ":")))
+        self._fd.write("\n")
+
+    def record(self, name: str, args: tuple, kwargs: dict, enqueued_at: float = None):
+        """
+        Record an event.
+
+        param:
+            name: the name of the event, for example "on_message"
+            args: the positional arguments of the event
+            kwargs: the keyword arguments of the event
+            enqueued_at: time.monotonic() of when the event was received,
+            now if not given
+        """
+        if enqueued_at is None:
+            enqueued_at = time.monotonic()
+        try:
+            self._write({
+                "time": enqueued_at - self._start_time,
+                "name": name,
+                "args": encode_value(args),
+                "kwargs": encode_value(kwargs)
+            })
+        except Exception:
+            logging.exception(f"failed to record event {name}")
+
+    def close(self):
+        self._fd.close()
+
+
+def read_recording(path: Path):
+    """
+    Read the events of a recording.
+
+    A recording that wasn't closed properly (the program crashed)
+    is read until where it is cut off.
+
+    param:
+        path: the recording file
+    returns:
+        generator of (time in seconds since the start of the recording,
+        event name, args tuple, kwargs dict)
+    """
+    with gzip.open(str(path), "rt") as fd:
+        try:
+            header = json.loads(fd.readline())
+            if header.get("version") != RECORDING_VERSION:
+                raise ValueError(f"unsupported recording version {header.get('version')}")
+            for line in fd:
+                event = json.loads(line)
+                yield (
+                    event["time"],
+                    event["name"],
+                    tuple(decode_value(event["args"])),
+                    decode_value(event["kwargs"])
+                )
+        except (EOFError, zlib.error, json.JSONDecodeError):
+            logging.warning(f"recording {path} is truncated")
@@ -0,0 +1,144 @@
+# Copyright 2021 Raidro Manchester
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+import collections
+import json
+from pathlib import Path
+
+
+class EventStats:
+    """
+    Debugging statistics of the event system: how many events of every kind
+    were dispatched, how long they waited between discord.py receiving them and
+    being dispatched, and how long every receiver's handlers take.
+
+    Collecting is only done when enabled, otherwise the only cost is
+    checking `enabled`, so check it before calling the recording methods.
+
+    attributes:
+        enabled: `bool` if statistics should be collected
+    """
+    # Upper bounds (inclusive) of the latency histogram buckets in milliseconds,
+    # the last bucket is for everything above.
+    LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._event_counts = collections.Counter()
+        # Event name -> list of counts for every bucket
+        self._latency_histograms = {}
+        # "Class.disc_on_event" -> [calls, total seconds, max seconds]
+        self._handler_times = {}
+
+    def record_event(self, name: str):
+        self._event_counts[name] += 1
+
+    def record_latency(self, name: str, latency: float):
+        """
+        param:
+            name: the name of the event
+            latency: seconds between the event being queued and dispatched
+        """
+        if name not in self._latency_histograms:
+            self._latency_histograms[name] = [0] * (len(self.LATENCY_BUCKETS_MS) + 1)
+        bucket = bisect.bisect_left(self.LATENCY_BUCKETS_MS, latency * 1000)
+        self._latency_histograms[name][bucket] += 1
+
+    def record_handler(self, receiver, name: str, duration: float):
+        """
+        param:
+            receiver: the receiver that handled the event
+            name: the name of the event
+            duration: seconds the handler took
+        """
+        handler_name = f"{type(receiver).__qualname__}.disc_{name}"
+        if handler_name not in self._handler_times:
+            self._handler_times[handler_name] = [0, 0.0, 0.0]
+        times = self._handler_times[handler_name]
+        times[0] += 1
+        times[1] += duration
+        times[2] = max(times[2], duration)
+
+    def to_dict(self, bridge=None, scheduler=None, prefetchers=None) -> dict:
+        """
+        Get the statistics in a json serializable form.
+
+        param:
+            bridge: optionally the `EventBridge` to include its queue counters
+            scheduler: optionally the `TaskScheduler` to include its queue depths
+            prefetchers: optionally `HistoryPrefetcher`s to include their
+            hits and misses in total
+        """
+        bucket_names = [f"<={bound}ms" for bound in self.LATENCY_BUCKETS_MS]
+        bucket_names.append(f">{self.LATENCY_BUCKETS_MS[-1]}ms")
+
+        stats = {
+            "enabled": self.enabled,
+            "event_counts": dict(self._event_counts.most_common()),
+            "latency_histograms": {
+                name: dict(zip(bucket_names, counts))
+                for name, counts in self._latency_histograms.items()
+            },
+            "handlers": {
+                handler_name: {
+                    "calls": calls,
+                    "total_ms": total * 1000,
+                    "average_ms": total * 1000 / calls,
+                    "max_ms": maximum * 1000
+                }
+                for handler_name, (calls, total, maximum) in sorted(
+                    self._handler_times.items(),
+                    key=lambda item : item[1][1],
+                    reverse=True
+                )
+            }
+        }
+        if bridge is not None:
+            stats["bridge"] = {
+                "coalesced": bridge.coalesced_count,
+                "resyncs": bridge.resync_count,
+                "shed": {
+                    lane.name: lane.shed_count
+                    for lane in (bridge.priority_lane, bridge.default_lane)
+                },
+                "queued": {
+                    lane.name: len(lane.queue)
+                    for lane in (bridge.priority_lane, bridge.default_lane)
+                }
+            }
+        if scheduler is not None:
+            stats["scheduler"] = scheduler.get_stats()
+        if prefetchers is not None:
+            prefetchers = list(prefetchers)
+            stats["prefetch"] = {
+                "hits": sum(prefetcher.hits for prefetcher in prefetchers),
+                "misses": sum(prefetcher.misses for prefetcher in prefetchers)
+            }
+        return stats
+
+    def dump(self, path: Path, bridge=None, scheduler=None, prefetchers=None):
+        """
+        Write the statistics to a json file.
+
+        param:
+            path: where to write them
+            bridge: optionally the `EventBridge` to include its queue counters
+            scheduler: optionally the `TaskScheduler` to include its queue depths
+            prefetchers: optionally `HistoryPrefetcher`s to include their
+            hits and misses in total
+        """
+        with open(str(path), "w") as fd:
+            json.dump(self.to_dict(bridge, scheduler, prefetchers), fd, indent=4)
@@ -0,0 +1,137 @@
+# Copyright 2021 Raidro Manchester
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import time
+
+
+class HistoryPrefetcher:
+    """
+    Decides when a message view should load older history, and how much.
+
+    Waiting until the top is almost reached means that when scrolling fast,
+    the user hits the top and has to wait for the page. Instead this tracks
+    how fast the user scrolls up and how long loading a page takes, and
+    starts loading early enough for the page to be there before it is needed.
+    Pages are sized to the viewport, based on the average row height.
+
+    A page that arrived before the user reached the top counts as a hit,
+    one the user had to wait for at the top as a miss.
+    """
+    MIN_PAGE_SIZE = 30
+    # Discord doesn't return more at once
+    MAX_PAGE_SIZE = 100
+    # Viewports of messages a page should be
+    PAGE_VIEWPORTS = 3
+    # Viewports above the visible part that should always be loaded
+    LOOKAHEAD_VIEWPORTS = 2
+    # Weight of a new sample in the smoothed velocity and load duration
+    _SMOOTHING = 0.3
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # Pixels per second, positive is upwards
+        self._velocity = 0.0
+        # (value, upper, time) of the last update
+        self._last_sample = None
+        # Seconds, a guess until the first page is loaded
+        self._load_duration = 0.5
+        self._load_started_at = None
+        # If the top was reached while the page was loading
+        self._stalled = False
+
+    def get_page_size(self, page_size: float, row_height: float) -> int:
+        """
+        Get how many messages to load for a viewport.
+
+        param:
+            page_size: the height of the viewport
+            row_height: the average height of a message
+        """
+        if row_height <= 0:
+            return self.MIN_PAGE_SIZE
+        messages = math.ceil(page_size / row_height * self.PAGE_VIEWPORTS)
+        return max(self.MIN_PAGE_SIZE, min(messages, self.MAX_PAGE_SIZE))
+
+    def update(self, value: float, page_size: float, upper: float, n_messages: int, now: float = None) -> int:
+        """
+        Update with the scroll position, call on every scroll.
+
+        param:
+            value, page_size, upper: of the vertical adjustment
+            n_messages: the number of loaded messages
+            now: optionally the time, time.monotonic() by default
+        returns:
+            how many older messages should be loaded now, 0 if none
+        """
+        if now is None:
+            now = time.monotonic()
+        if self._last_sample is not None:
+            last_value, last_upper, last_time = self._last_sample
+            # Loading history above moves the value without any scrolling
+            if upper == last_upper and now > last_time:
+                velocity = (last_value - value) / (now - last_time)
+                self._velocity += self._SMOOTHING * (velocity - self._velocity)
+        self._last_sample = (value, upper, now)
+
+        if not n_messages or upper <= 0:
+            return 0
+        row_height = upper / n_messages
+        if self._load_started_at is not None:
+            if value < row_height:
+                self._stalled = True
+            return 0
+
+        # What will be scrolled while the page loads, with room to spare
+        scrolled_while_loading = max(self._velocity, 0) * self._load_duration * 2
+        threshold = max(page_size * self.LOOKAHEAD_VIEWPORTS, scrolled_while_loading + page_size)
+        if value >= threshold:
+            return 0
+        return self.get_page_size(page_size, row_height)
+
+    def load_started(self, now: float = None):
+        self._load_started_at = time.monotonic() if now is None else now
+        self._stalled = False
+
+    def load_finished(self, succeeded=True, now: float = None):
+        """
+        Call when the page of `load_started` is loaded.
+
+        param:
+            succeeded: False if it failed, it then doesn't count
+            now: optionally the time, time.monotonic() by default
+        """
+        if self._load_started_at is None:
+            return
+        if now is None:
+            now = time.monotonic()
+        if succeeded:
+            duration = now - self._load_started_at
+            self._load_duration += self._SMOOTHING * (duration - self._load_duration)
+            if self._stalled:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self._load_started_at = None
+        self._stalled = False
+
+    def get_stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "velocity": self._velocity,
+            "load_duration_ms": self._load_duration * 1000
+        }
@@ -14,13 +14,13 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import discord
+import logging
 import time
 import os
 import subprocess
-import asyncio
-import threading
 from pathlib import Path
 from gi.repository import Adw, Gtk, Gdk, GLib, Gio
+from .scheduler import run_on_discord
 from .attachment import ImageAttachment, AttachmentType, get_attachment_type
 
 
@@ -86,17 +86,11 @@ class ImageViewer(Adw.Flap):
 
     @Gtk.Template.Callback()
     def _on_navigate_forward(self, button: Gtk.Button):
-        threading.Thread(
-            target=self._navigate_media_target,
-            args=(True,)
-        ).start()
+        self._navigate_media(True)
 
     @Gtk.Template.Callback()
     def _on_navigate_back(self, button: Gtk.Button):
-        threading.Thread(
-            target=self._navigate_media_target,
-            args=(False,)
-        ).start()
+        self._navigate_media(False)
 
     async def _check_if_first_media(self) -> bool:
         async for message in self.context.channel_disc.history(limit=None):
@@ -109,12 +103,8 @@ class ImageViewer(Adw.Flap):
         # Very rare edge case (deleted) if this is executed
         return True
 
-    def _check_if_first_media_target(self):
-        is_first = asyncio.run_coroutine_threadsafe(
-            self._check_if_first_media(),
-            self.app.discord_loop
-        ).result()
-        GLib.idle_add(lambda *_: self._catalog_back.set_visible(not is_first))
+    def _check_if_first_media_gtk_target(self, is_first: bool):
+        self._catalog_back.set_visible(not is_first)
 
     def _signify_catalog_load_start(self):
         self._loading_notif_revealer.set_reveal_child(True)
@@ -160,27 +150,23 @@ class ImageViewer(Adw.Flap):
 
         new_image_wid.connect("image_fully_loaded", on_full_render)
 
-    def _navigate_media_target(self, forward: bool):
-        GLib.idle_add(self._signify_catalog_load_start)
+    def _navigate_media(self, forward: bool):
+        self._signify_catalog_load_start()
+        run_on_discord(
+            self._get_next_attachment() if forward else self._get_previous_attachment(),
+            callback=self._navigate_media_gtk_target,
+            error_callback=self._navigate_media_error_gtk_target
+        )
 
-        if forward:
-            next_attachment = asyncio.run_coroutine_threadsafe(
-                self._get_next_attachment(),
-                self.app.discord_loop
-            ).result()
-            if next_attachment:
-                GLib.idle_add(self._setup_new_imge, next_attachment)
-            else:
-                self._signify_catalog_load_end()
+    def _navigate_media_gtk_target(self, new_attachment: discord.Attachment):
+        if new_attachment:
+            self._setup_new_imge(new_attachment)
         else:
-            previous_attachment = asyncio.run_coroutine_threadsafe(
-                self._get_previous_attachment(),
-                self.app.discord_loop
-            ).result()
-            if previous_attachment:
-                GLib.idle_add(self._setup_new_imge, previous_attachment)
-            else:
-                self._signify_catalog_load_end()
+            self._signify_catalog_load_end()
+
+    def _navigate_media_error_gtk_target(self, error: Exception):
+        logging.error("failed to navigate media", exc_info=error)
+        self._signify_catalog_load_end()
 
     def _action_open_in_app(self, *args):
         subprocess.run(["xdg-open", str(self._current_image_path)])
@@ -226,4 +212,7 @@ class ImageViewer(Adw.Flap):
         )
 
         self._window_title.set_title(self._current_attachment.filename)
-        threading.Thread(target=self._check_if_first_media_target).start()
+        run_on_discord(
+            self._check_if_first_media(),
+            callback=self._check_if_first_media_gtk_target
+        )
@@ -14,7 +14,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import linkpreview
-import threading
 import logging
 import requests
 import urllib
@@ -22,7 +21,8 @@ import hashlib
 import os
 import gi
 from pathlib import Path
-from gi.repository import Gtk, Gdk, GdkPixbuf, GLib
+from gi.repository import Gtk, Gdk, GdkPixbuf
+from .scheduler import TaskCategory, CancellationScope
 
 
 @Gtk.Template(resource_path="/org/gnome/gitlab/ranchester/Mirdorph/ui/link_preview.ui")
@@ -34,22 +34,44 @@ class LinkPreviewExport(Gtk.ListBox):
     _link_label: Gtk.Label = Gtk.Template.Child()
     _link_image: Gtk.Image = Gtk.Template.Child()
 
-    def __init__(self, link: str, *args, **kwargs):
+    def __init__(self, link: str, preview_cache: dict = None, *args, **kwargs):
+        """
+        Create a LinkPreviewExport
+
+        param:
+            link: the link to preview
+            preview_cache: optional dict of link -> (title, image path) of
+            previews that were already fetched, it is used instead of fetching
+            again, and the result is added to it
+        """
         Gtk.ListBox.__init__(self, *args, **kwargs)
         self.link = link
         self._link_label.set_label(link)
+        self._preview_cache = preview_cache
+
+        self._scope = CancellationScope()
+        if preview_cache is not None and link in preview_cache:
+            self._display_preview(*preview_cache[link])
+        else:
+            self._scope.submit(TaskCategory.NETWORK, self._fetch_preview)
 
-        threading.Thread(target=self._fetch_preview).start()
+    def discard(self):
+        """
+        Stop fetching the preview, when it isn't displayed anymore.
+        """
+        self._scope.cancel()
 
     def _fetch_preview(self):
         try:
             preview = linkpreview.link_preview(self.link)
         except:
             logging.warning(f"could not get preview for {self.link}")
+            # So that it isn't tried again every time it is displayed
+            self._scope.idle_add(self._display_preview, None, None)
             return
 
         image_path = None
-        if preview.image:
+        if preview.image and not self._scope.cancelled:
             try:
                 r = requests.get(preview.image)
             except requests.exceptions.MissingSchema:
@@ -68,9 +90,11 @@ class LinkPreviewExport(Gtk.ListBox):
             with open(image_path, "wb") as f:
                 f.write(r.content)
 
-        GLib.idle_add(self._display_preview, preview.title, image_path)
+        self._scope.idle_add(self._display_preview, preview.title, image_path)
 
     def _display_preview(self, title: str, image_path: str):
+        if self._preview_cache is not None:
+            self._preview_cache[self.link] = (title, image_path)
         if title:
             self._link_label.set_label(title)
         if image_path:
@@ -25,9 +25,12 @@ from pathlib import Path
 from .login_window import MirdorphLoginWindow
 from .main_window import MirdorphMainWindow
 from .event_manager import EventManager
+from .scheduler import TaskScheduler
 from .channel_inner_window import ChannelInnerWindow
 from .settings_window import MirdorphSettingsWindow
 from .confman import ConfManager
+from .message_store import MessageStore
+from .warmup import ChannelWarmup
 from .plugin import MrdPluginEngine, MrdExtensionSet, MrdApplicationPlugin
 
 
@@ -42,10 +45,19 @@ class Application(Adw.Application):
         self.keyring_exists = keyring_exists
 
         self.confman = ConfManager()
+        # The latest messages of channels, to show when opening them
+        self.message_store = MessageStore()
+        # Loads recently opened channels in the background after connecting
+        self.warmup = ChannelWarmup()
         self.event_manager = EventManager()
+        # Blocking work (network, waiting for discord) of the whole program
+        self.scheduler = TaskScheduler()
         self.plugin_engine = MrdPluginEngine()
 
+        # In order of when they were last shown, most recent last
         self._inner_window_contexts = {}
+        # Channel id -> snapshot of contexts hibernated to save memory
+        self._hibernated_contexts = {}
 
         # Why the custom member cache? Doesn't discord.py have one?
         # Yes, however it usually doesn't actually work, which leads to doing
@@ -53,6 +65,8 @@ class Application(Adw.Application):
         # color for the author of a message. We can optimise quite a lot by
         # implementing this custom cache.
         self.custom_member_cache = {}
+        # Author id -> callbacks waiting for the member being fetched
+        self.pending_member_fetches = {}
 
     def do_startup(self):
         Adw.Application.do_startup(self)
@@ -93,6 +107,11 @@ class Application(Adw.Application):
             {
                 "name": "logout",
                 "func": self.log_out
+            },
+            {
+                "name": "dump-event-stats",
+                "func": self.dump_event_stats,
+                "accel": "<Control><Shift>e"
             }
         ]
 
@@ -139,6 +158,11 @@ class Application(Adw.Application):
             # We don't want to empty the enabled plugin conf here
             plugin.disconnect_by_func(self._sync_enabled_plugins_with_conf)
             self.plugin_engine.unload_plugin(plugin)
+        self.warmup.stop()
+        # The process is killed below, so the recording wouldn't be finished
+        dispatcher = self.discord_client.get_cog("EventListeningDispatcher")
+        if dispatcher and dispatcher.recorder:
+            dispatcher.recorder.close()
         # Dangerous, but we need to kill the discord thread for now
         os._exit(0)
 
@@ -167,8 +191,35 @@ class Application(Adw.Application):
         dialog.set_transient_for(self.main_win)
         dialog.present()
 
+    def dump_event_stats(self, *args):
+        """
+        Write the debugging statistics of the event system to
+        $XDG_CACHE_HOME/mirdorph-event-stats.json, they are only
+        collected with MIRDORPH_EVENT_STATS=1 set.
+        """
+        if not self.event_manager.stats.enabled:
+            logging.warning("event statistics are disabled, set MIRDORPH_EVENT_STATS=1 to collect them")
+            return
+        # Not in the normal cache directory, as that is cleared on every start
+        stats_path = Path(os.environ["XDG_CACHE_HOME"]) / "mirdorph-event-stats.json"
+        dispatcher = self.discord_client.get_cog("EventListeningDispatcher")
+        self.event_manager.stats.dump(
+            stats_path,
+            bridge=dispatcher.bridge if dispatcher else None,
+            scheduler=self.scheduler,
+            prefetchers=[
+                context.history_prefetcher
+                for context in self._inner_window_contexts.values()
+            ]
+        )
+        logging.info(f"event statistics written to {stats_path}")
+
     def log_out(self, *args):
         keyring.delete_password("mirdorph", "token")
+        # It would keep writing to the store
+        self.warmup.stop()
+        self.message_store.clear()
+        self.confman.set_value("recent_channels", [])
         self.relaunch()
     
     def create_inner_window_context(self, channel: int, flap: Adw.Flap):
@@ -184,6 +235,9 @@ class Application(Adw.Application):
         """
         context = ChannelInnerWindow(empty=False, channel=channel)
         flap.connect("notify::folded", context.handle_flap_folding)
+        snapshot = self._hibernated_contexts.pop(channel, None)
+        if snapshot is not None:
+            context.restore_snapshot(snapshot)
 
         self.main_win.context_stack.add_child(context)
         self._inner_window_contexts[channel] = context
@@ -203,9 +257,59 @@ class Application(Adw.Application):
         """
         if channel not in self._inner_window_contexts:
             self.create_inner_window_context(channel, self.main_win.main_flap)
+            self._hibernate_inner_window_contexts()
+        else:
+            # Now the most recently used
+            self._inner_window_contexts[channel] = self._inner_window_contexts.pop(channel)
 
         return self._inner_window_contexts[channel]
 
+    def _hibernate_inner_window_contexts(self):
+        """
+        Close the least recently used contexts while there are more than
+        max_live_channels, keeping only a snapshot to restore them. Otherwise
+        every channel ever opened keeps its messages in memory and receives
+        events forever.
+        """
+        excess = len(self._inner_window_contexts) - self.confman.get_value("max_live_channels")
+        # Not the most recent one, it is about to be shown
+        for channel, context in list(self._inner_window_contexts.items())[:-1]:
+            if excess <= 0:
+                break
+            # Still being looked at
+            if context.is_poped or self.main_win.context_stack.get_visible_child() is context:
+                continue
+            snapshot = context.get_snapshot()
+            self.close_inner_window_context(channel)
+            self._hibernated_contexts[channel] = snapshot
+            excess -= 1
+
+    def has_inner_window_context(self, channel: int) -> bool:
+        """
+        Check if a channel has an inner window context that isn't hibernated,
+        without creating one. Can be called from any thread.
+
+        param:
+            channel: integer of the id of the channel
+        """
+        return channel in self._inner_window_contexts
+
+    def close_inner_window_context(self, channel: int):
+        """
+        Close an inner window context for a channel and stop everything
+        it does in the background, if it exists.
+
+        param:
+            channel: integer of the id of the channel
+        """
+        self._hibernated_contexts.pop(channel, None)
+        context = self._inner_window_contexts.pop(channel, None)
+        if context is None:
+            return
+        context.teardown()
+        self.main_win.main_flap.disconnect_by_func(context.handle_flap_folding)
+        self.main_win.context_stack.remove(context)
+
     def relaunch(self):
         logging.info("launching program duplicate instance")
         os.execv(sys.argv[0], sys.argv)
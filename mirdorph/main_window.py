@@ -59,6 +59,7 @@ class MirdorphMainWindow(Adw.ApplicationWindow, EventReceiver):
         # on_ready shows that overall we are connected, and client.guilds
         # becomes available
         self._loading_stack.set_visible_child_name("session")
+        self.props.application.warmup.start()
 
     def _setting_switching_focus_gtk_target(self, context):
         try:
@@ -125,6 +126,7 @@ class MirdorphMainWindow(Adw.ApplicationWindow, EventReceiver):
             to display
         """
         context = self.props.application.retrieve_inner_window_context(channel_id)
+        self.props.application.warmup.record_channel_opened(channel_id)
         if context.is_poped:
             temp_win_top = context.get_native()
             if temp_win_top:
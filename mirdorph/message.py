@@ -13,46 +13,62 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import random
-import time
-import asyncio
 import logging
-import threading
 import discord
 import os
 from pathlib import Path
 from xml.sax.saxutils import escape as escape_xml
 from gi.repository import Adw, Gtk, GObject, Gio, GLib, Gdk, GdkPixbuf
 from .event_receiver import EventReceiver
+from .scheduler import CancellationScope, run_on_discord
 from .attachment import GenericAttachment, ImageAttachment, AttachmentType, get_attachment_type
-from .message_parsing import MessageComponent, calculate_msg_parts
+from .message_parsing import MessageComponent, parse_message
+
+
+def get_avatar_path(user_id: int) -> Path:
+    """
+    Get where the avatar of a user is downloaded to.
+
+    param:
+        user_id: the id of the user
+    """
+    return Path(
+        os.environ["XDG_CACHE_HOME"] / Path("mirdorph")
+        / f"user_{str(user_id)}.png"
+    )
+
 
 class MessageContent(Gtk.Box):
     def __init__(self, *args, **kwargs):
         Gtk.Box.__init__(self, orientation=Gtk.Orientation.VERTICAL, *args, **kwargs)
-        self._message_content = None
         self.exports = []
+        # Components of previous binds, kept to be used again,
+        # as most messages only have one
+        self._spare_components = []
 
-    def bind(self, content: str):
-        self._message_content = content
+    def bind(self, parsed_content: list):
+        """
+        Display a message.
 
-        for found_part in calculate_msg_parts(self._message_content):
-            component = MessageComponent(found_part[1], component_type=found_part[0])
+        param:
+            parsed_content: list of `ParsedComponent` of the message,
+            like from `MessageMobject.get_parsed_content`
+        """
+        for parsed_component in parsed_content:
+            if self._spare_components:
+                component = self._spare_components.pop()
+            else:
+                component = MessageComponent()
+            component.bind(parsed_component)
             self.exports.extend(component.exports)
             self.append(component)
 
     def unbind(self):
-        self._message_content = None
-
         self.exports.clear()
-        for component in self:
+        for component in list(self):
+            component.unbind()
             self.remove(component)
-
-    def _do_parse_construct(self) -> list:
-        return [
-            MessageComponent(comp[1], component_type=comp[0])
-            for comp in calculate_msg_parts(self._message_content)
-        ]
+            self._spare_components.append(component)
 
 
 class MessageMobject(GObject.GObject, EventReceiver):
@@ -88,6 +104,8 @@ class MessageMobject(GObject.GObject, EventReceiver):
         GObject.GObject.__init__(self)
         EventReceiver.__init__(self)
         self.app = Gio.Application.get_default()
+        # The avatar and color fetches, stopped by discard()
+        self._scope = CancellationScope()
         self.is_header = is_header
         if self.is_header:
             return
@@ -100,6 +118,9 @@ class MessageMobject(GObject.GObject, EventReceiver):
         # also allow us to handle events well
         self.content = self._disc_message.content
         self.created_at = self._disc_message.created_at
+        self.edited_at = self._disc_message.edited_at
+        # Of the content, parsed when first displayed
+        self._parsed_content = None
         self.author = self._disc_message.author
         self.attachments = self._disc_message.attachments
         self.channel = self._disc_message.channel
@@ -108,21 +129,20 @@ class MessageMobject(GObject.GObject, EventReceiver):
 
         # Additional "lazy" loading of properties like the username color, avatar
         # should happen in the Mobject, not the widget
-        threading.Thread(target=self._fetch_label_color_target).start()
-        threading.Thread(target=self._fetch_avatar_target).start()
+        self._fetch_label_color()
+        self._fetch_avatar()
 
-    def _helper_get_member(self) -> discord.Member:
+    def _helper_get_member(self, callback):
         """
         Efficiently get our discord member.
 
         Such complication is required becaused .author isn't always one,
         and it is easy to make a lot of API calls getting one.
 
-        NOTE: only call this from the non blocking thread
-
-        returns:
-            discord.Member - if it worked,
-            None - if everything failed (sometimes happens, 404 bug)
+        param:
+            callback: called on the GTK thread with the discord.Member,
+            right away if it is cached. Not called if everything failed
+            (sometimes happens, 404 bug)
         """
         # When we receive a message, it is a Member, however from history
         # it is a user.
@@ -137,32 +157,49 @@ class MessageMobject(GObject.GObject, EventReceiver):
                 if member:
                     self.app.custom_member_cache[member.id] = member
                 else:
-                    # Sometimes when fetching members like this it simply isn't found for
-                    # seemingly no reason. Maybe it is todo with if they are online?
-                    try:
-                        member = asyncio.run_coroutine_threadsafe(
-                            self.guild.fetch_member(
-                                self.author.id
-                            ),
-                            self.app.discord_loop
-                        ).result()
-                        self.app.custom_member_cache[self.author.id] = member
-                    except discord.errors.NotFound:
-                        logging.warning(f"could not get member info of {self.author}, 404?")
-                        return
-        return member
-
-    def _fetch_label_color_target(self):
+                    self._wait_for_member_fetch(callback)
+                    return
+        callback(member)
+
+    def _wait_for_member_fetch(self, callback):
+        # A page of history often has many messages of the same author, they
+        # all wait for the same fetch instead of each doing their own.
+        def scoped_callback(member: discord.Member):
+            if not self._scope.cancelled:
+                callback(member)
+
+        waiting = self.app.pending_member_fetches.get(self.author.id)
+        if waiting is None:
+            waiting = self.app.pending_member_fetches[self.author.id] = []
+            # Not in our scope, as others may be waiting for it
+            run_on_discord(
+                self.guild.fetch_member(self.author.id),
+                callback=self._on_member_fetched,
+                error_callback=self._on_member_fetch_error
+            )
+        waiting.append(scoped_callback)
+
+    def _on_member_fetched(self, member: discord.Member):
+        self.app.custom_member_cache[self.author.id] = member
+        for callback in self.app.pending_member_fetches.pop(self.author.id, []):
+            callback(member)
+
+    def _on_member_fetch_error(self, error: Exception):
+        self.app.pending_member_fetches.pop(self.author.id, None)
+        # Sometimes when fetching members like this it simply isn't found for
+        # seemingly no reason. Maybe it is todo with if they are online?
+        if isinstance(error, discord.errors.NotFound):
+            logging.warning(f"could not get member info of {self.author}, 404?")
+        else:
+            logging.error(f"could not get member info of {self.author}", exc_info=error)
+
+    def _fetch_label_color(self):
         # Those with 0000 are generally "fake" members that are invalid
         if self.author.discriminator == "0000":
             return
+        self._helper_get_member(self._apply_member_color)
 
-        # Really needed especially with all Mobjects attempting to fetch it
-        time.sleep(random.uniform(0.25, 3))
-
-        member = self._helper_get_member()
-        if member is None:
-            return
+    def _apply_member_color(self, member: discord.Member):
         top_role = member.roles[-1]
         color_formatted = "#%02x%02x%02x" % top_role.color.to_rgb()
 
@@ -171,31 +208,74 @@ class MessageMobject(GObject.GObject, EventReceiver):
         if color_formatted == "#000000":
             return
 
-        GLib.idle_add(self._label_color_gtk_target, color_formatted)
-
-    def _label_color_gtk_target(self, color: str):
-        self.props.username_color = color
+        self.props.username_color = color_formatted
 
-    def _fetch_avatar_target(self):
+    def _fetch_avatar(self):
         avatar_asset = self.author.avatar_url_as(size=1024, format="png")
 
         # Not directly set to the property here, as it needs to be downloaded
-        avatar_icon_path = Path(
-            os.environ["XDG_CACHE_HOME"] / Path("mirdorph")
-            / f"user_{str(self.author.id)}.png"
-        )
+        avatar_icon_path = get_avatar_path(self.author.id)
 
-        if not avatar_icon_path.is_file():
-            asyncio.run_coroutine_threadsafe(
+        if avatar_icon_path.is_file():
+            self._avatar_gtk_target(avatar_icon_path)
+        else:
+            self._scope.run_on_discord(
                 avatar_asset.save(str(avatar_icon_path)),
-                self.app.discord_loop
-            ).result()
-
-        GLib.idle_add(self._avatar_gtk_target, avatar_icon_path)
+                callback=lambda _ : self._avatar_gtk_target(avatar_icon_path)
+            )
 
     def _avatar_gtk_target(self, avatar_icon_path: str):
         self.props.avatar_file = avatar_icon_path
 
+    def update_message(self, disc_message: discord.Message):
+        """
+        Update to an edited version of the message.
+
+        NOTE: rows aren't updated by themselves, the model has to
+        announce the change.
+
+        param:
+            disc_message: the new `discord.Message`
+        """
+        self._disc_message = disc_message
+        self.content = disc_message.content
+        self.edited_at = disc_message.edited_at
+        self._parsed_content = None
+        self.attachments = disc_message.attachments
+
+    def update_content(self, content: str, edited_at):
+        """
+        Update only the content, for edits of messages discord.py doesn't
+        have, where there is no full message.
+
+        param:
+            content: the new content
+            edited_at: `datetime.datetime` of the edit
+        """
+        self.content = content
+        self.edited_at = edited_at
+        self._parsed_content = None
+
+    def get_parsed_content(self) -> list:
+        """
+        Get the content parsed for displaying it, it is only
+        parsed again after the message was edited.
+
+        returns:
+            list of `ParsedComponent`
+        """
+        if self._parsed_content is None:
+            self._parsed_content = parse_message(self.content)
+        return self._parsed_content
+
+    def discard(self):
+        """
+        Stop all background work of the mobject and stop receiving events,
+        call this when removing it from the model for good.
+        """
+        self._scope.cancel()
+        self.app.event_manager.unregister_receiver(self)
+
 
 @Gtk.Template(resource_path="/org/gnome/gitlab/ranchester/Mirdorph/ui/message.ui")
 class MessageWidget(Gtk.Box):
@@ -291,7 +371,7 @@ class MessageWidget(Gtk.Box):
         self._item.connect("notify::username-color", self._handle_username_color)
         self._item.connect("notify::avatar-file", self._handle_avatar)
 
-        self._message_content_wid.bind(self._item.content)
+        self._message_content_wid.bind(self._item.get_parsed_content())
 
         self._username_label.set_label(escape_xml(self._item.author.name))
         self._avatar.set_text(self._item.author.name)
@@ -329,19 +409,24 @@ class MessageWidget(Gtk.Box):
         Lose all state specific to a mobject, this allows the widget to be
         reused for another message
         """
+        # The handlers are on the mobject, otherwise every bind adds more
+        # that are never removed
+        if self._item is not None:
+            # Not always connected, even with handler id
+            try:
+                self._item.disconnect_by_func(self._handle_merge)
+                self._item.disconnect_by_func(self._handle_username_color)
+                self._item.disconnect_by_func(self._handle_avatar)
+            except TypeError:
+                pass
         self._item = None
 
-        # Not always connected, even with handler id
-        try:
-            self.disconnect_by_func(self._handle_merge)
-            self.disconnect_by_func(self._handle_username_color)
-            self.disconnect_by_func(self._handle_avatar)
-        except TypeError:
-            pass
-
         for exp_att_wid in self._added_att_exp:
+            # The row went out of view, its downloads aren't needed anymore
+            exp_att_wid.discard()
             if exp_att_wid in self._attachment_box:
                 self._attachment_box.remove(exp_att_wid)
+        self._added_att_exp.clear()
 
         self._avatar.set_text("")
         self._avatar.set_custom_image(None)
@@ -14,7 +14,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import asyncio
-import threading
 import discord
 from pathlib import Path
 from gettext import gettext as _
@@ -22,6 +21,7 @@ from gi.repository import Adw, Gtk, Gio, GLib
 from .confman import ConfManager
 from .attachment import MessageEntryBarAttachment
 from .event_receiver import EventReceiver
+from .scheduler import run_on_discord
 
 
 @Gtk.Template(resource_path="/org/gnome/gitlab/ranchester/Mirdorph/ui/message_entry_bar.ui")
@@ -37,7 +37,7 @@ class MessageEntryBar(Gtk.Box, EventReceiver):
 
     def __init__(self, context, *args, **kwargs):
         Gtk.Box.__init__(self, *args, **kwargs)
-        EventReceiver.__init__(self)
+        EventReceiver.__init__(self, channel_id=context.channel_id)
         self.context = context
         self.app = Gio.Application.get_default()
 
@@ -52,7 +52,10 @@ class MessageEntryBar(Gtk.Box, EventReceiver):
         self.app.confman.connect("setting-changed", self._on_confman_setting_changed)
         self._should_send_typing_events = self.app.confman.get_value("send_typing_events")
 
-        threading.Thread(target=self._check_if_can_send_target).start()
+        run_on_discord(
+            self._channel_is_sendable_to_you(self.context.channel_disc),
+            callback=self._check_if_can_send_gtk_target
+        )
 
     def _on_confman_setting_changed(self, confman: ConfManager, setting: str):
         self._should_send_typing_events = self.app.confman.get_value("send_typing_events")
@@ -65,19 +68,51 @@ class MessageEntryBar(Gtk.Box, EventReceiver):
         """
         self._message_entry.grab_focus()
 
+    def get_draft(self) -> tuple:
+        """
+        Get what was entered but not sent yet.
+
+        returns:
+            tuple of the text and a list of the filenames of the attachments
+        """
+        return (
+            self._message_entry.get_text(),
+            [att_wid.full_filename for att_wid in self.added_attachments_wid]
+        )
+
+    def restore_draft(self, text: str, filenames: list):
+        """
+        Restore a draft from `get_draft`.
+
+        param:
+            text: the text of the entry
+            filenames: list of the filenames of the attachments
+        """
+        self._message_entry.set_text(text)
+        for filename in filenames:
+            att_wid = MessageEntryBarAttachment(
+                visible=True,
+                add_mode=False,
+                filename=filename
+            )
+            self._attachment_container.append(att_wid)
+            self.added_attachments_wid.append(att_wid)
+        self.emulate_attachment_container_change()
+
+    def teardown(self):
+        """
+        Stop receiving events and setting changes, the bar can't be used
+        anymore afterwards.
+        """
+        self.app.confman.disconnect_by_func(self._on_confman_setting_changed)
+        self.app.event_manager.unregister_receiver(self)
+
     async def _channel_is_sendable_to_you(self, channel: discord.abc.GuildChannel) -> bool:
         our_permissions = channel.permissions_for(
             await channel.guild.fetch_member(self.app.discord_client.user.id)
         )
         return our_permissions.send_messages
 
-    def _check_if_can_send_target(self):
-        can_send = asyncio.run_coroutine_threadsafe(
-            self._channel_is_sendable_to_you(self.context.channel_disc),
-            self.app.discord_loop
-        ).result()
-        GLib.idle_add(self._check_if_can_send_gtk_target, can_send)
-
     def _check_if_can_send_gtk_target(self, can_send: bool):
         if not can_send:
             self.set_sensitive(can_send)
@@ -123,6 +158,7 @@ class MessageEntryBar(Gtk.Box, EventReceiver):
 
         for child in self.added_attachments_wid:
             self._attachment_container.remove(child)
+        self.added_attachments_wid.clear()
         self._attachment_togglebutton.set_active(False)
         self._message_entry.set_text("")
 
@@ -0,0 +1,208 @@
+# Copyright 2021 Raidro Manchester
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+from gi.repository import Gio, GObject
+
+
+class MessageListModel(GObject.Object, Gio.ListModel):
+    """
+    The model of a message view: a header item at position 0, and after it
+    the messages sorted by their id. Discord ids are snowflakes, so this is
+    also the order in which they were sent.
+
+    This replaces a Gio.ListStore sorted with a Gtk.SortListModel and a
+    Python sort function, which was called for every comparison on every
+    change, flattened with a separate model for the header. Here new items
+    are placed with a binary search, and items-changed is only emitted for
+    the ranges that actually changed.
+
+    Items only need an `id` attribute, positions of messages ("index") don't
+    count the header, positions of the model do.
+    """
+    def __init__(self, header: GObject.Object):
+        """
+        Create a MessageListModel.
+
+        param:
+            header: the item at position 0, all items must be of its type
+        """
+        GObject.Object.__init__(self)
+        self._header = header
+        self._items = []
+        # Ids of _items, for bisect
+        self._ids = []
+
+    def do_get_item_type(self):
+        return self._header.__gtype__
+
+    def do_get_n_items(self) -> int:
+        return len(self._items) + 1
+
+    def do_get_item(self, position: int):
+        if position == 0:
+            return self._header
+        if 0 < position <= len(self._items):
+            return self._items[position - 1]
+        return None
+
+    def get_n_messages(self) -> int:
+        return len(self._items)
+
+    def get_message(self, index: int):
+        """
+        Get a message by its index, 0 being the oldest.
+
+        returns:
+            the item, or None if out of range
+        """
+        if 0 <= index < len(self._items):
+            return self._items[index]
+        return None
+
+    def index_of(self, message_id: int) -> int:
+        """
+        Find the index of a message.
+
+        param:
+            message_id: the id of the message
+        returns:
+            the index, or -1 if it isn't in the model
+        """
+        index = bisect.bisect_left(self._ids, message_id)
+        if index < len(self._ids) and self._ids[index] == message_id:
+            return index
+        return -1
+
+    def insert(self, items: list) -> list:
+        """
+        Insert items at their position, items already in the model are ignored.
+
+        Items that end up next to each other are inserted together, so a page
+        of history is a single items-changed, however big it is.
+
+        param:
+            items: the items to insert, in any order
+        returns:
+            list of the items that were actually inserted, oldest first
+        """
+        items = sorted(items, key=lambda item : item.id)
+        # Runs of new items that go between the same two existing items,
+        # as (index before inserting anything, items)
+        runs = []
+        inserted = []
+        for item in items:
+            if inserted and inserted[-1].id == item.id:
+                continue
+            index = bisect.bisect_left(self._ids, item.id)
+            if index < len(self._ids) and self._ids[index] == item.id:
+                continue
+            if runs and runs[-1][0] == index:
+                runs[-1][1].append(item)
+            else:
+                runs.append((index, [item]))
+            inserted.append(item)
+
+        # Every run moves the ones after it by its length. The model must
+        # already look like items-changed says when emitting it.
+        offset = 0
+        for index, run in runs:
+            index += offset
+            self._items[index:index] = run
+            self._ids[index:index] = [item.id for item in run]
+            self.items_changed(index + 1, 0, len(run))
+            offset += len(run)
+        return inserted
+
+    def remove_range(self, index: int, n_items: int) -> list:
+        """
+        Remove messages.
+
+        param:
+            index: the index of the first message to remove
+            n_items: how many to remove
+        returns:
+            list of the removed items
+        """
+        removed = self._items[index:index + n_items]
+        if not removed:
+            return removed
+        del self._items[index:index + len(removed)]
+        del self._ids[index:index + len(removed)]
+        self.items_changed(index + 1, len(removed), 0)
+        return removed
+
+    def remove(self, message_id: int):
+        """
+        Remove a message.
+
+        param:
+            message_id: the id of the message
+        returns:
+            the removed item, or None if it wasn't in the model
+        """
+        index = self.index_of(message_id)
+        if index == -1:
+            return None
+        return self.remove_range(index, 1)[0]
+
+    def remove_ids(self, message_ids) -> list:
+        """
+        Remove messages, every run of them next to each other is removed
+        with a single items-changed.
+
+        param:
+            message_ids: iterable of the ids, ones not in the model are ignored
+        returns:
+            list of the removed items, oldest first
+        """
+        indexes = sorted({index for index in map(self.index_of, message_ids) if index != -1})
+        # [index, length] of runs of messages next to each other
+        runs = []
+        for index in indexes:
+            if runs and runs[-1][0] + runs[-1][1] == index:
+                runs[-1][1] += 1
+            else:
+                runs.append([index, 1])
+        removed = []
+        # From the last one, so the indexes of the others stay the same
+        for index, n_items in reversed(runs):
+            removed[:0] = self.remove_range(index, n_items)
+        return removed
+
+    def update(self, message_id: int) -> bool:
+        """
+        Tell views of the model that a message changed, so its row is
+        created again.
+
+        param:
+            message_id: the id of the message
+        returns:
+            if the message is in the model
+        """
+        index = self.index_of(message_id)
+        if index == -1:
+            return False
+        self.items_changed(index + 1, 1, 1)
+        return True
+
+    def remove_all(self) -> list:
+        """
+        Remove all messages, the header stays.
+
+        returns:
+            list of the removed items
+        """
+        return self.remove_range(0, len(self._items))
@@ -110,11 +110,14 @@ def _extract_discord_components(message_string) -> list:
     return []
 
 
-def _generate_exports(message_string: str, include_links: bool=True):
-    links = []
-    if include_links:
-        links = re.findall(r"(?P<url>https?://[^\s]+)", message_string)
-    return [LinkPreviewExport(link) for link in links]
+def _find_links(message_string: str) -> list:
+    return re.findall(r"(?P<url>https?://[^\s]+)", message_string)
+
+
+def _generate_exports(links: list, include_links: bool=True, preview_cache: dict=None):
+    if not include_links:
+        return []
+    return [LinkPreviewExport(link, preview_cache=preview_cache) for link in links]
 
 
 def _create_pango_markup(message_string: str) -> str:
@@ -145,29 +148,85 @@ def build_widget_list(message_string: str) -> list:
     return widget_list
 
 
+class ParsedComponent:
+    """
+    A component of a message, parsed into what is needed to display it.
+    Parsing is slow compared to displaying, and rows are bound again all the
+    time while scrolling, so this is kept and displayed without parsing again.
+    """
+    def __init__(self, component_type: ComponentType, markup: str, links: list):
+        """
+        Create a ParsedComponent
+
+        param:
+            component_type: the `ComponentType` of the component
+            markup: the pango markup of the text
+            links: list of the links in the text, for exports
+        """
+        self.component_type = component_type
+        self.markup = markup
+        self.links = links
+        # Link -> (title, image path) of fetched link previews, so that
+        # they aren't downloaded again for every bind
+        self.link_previews = {}
+
+
+def parse_message(original_content: str) -> list:
+    """
+    Parse a str message into everything needed to display it.
+
+    returns:
+        `list` of `ParsedComponent`
+    """
+    return [
+        ParsedComponent(
+            component_type,
+            # Safe currently as only strings
+            "".join(build_widget_list(component_text)),
+            # Exports are based on non-sescaped, non-processed content
+            _find_links(component_text)
+        )
+        for component_type, component_text in calculate_msg_parts(original_content)
+    ]
+
+
 class MessageComponent(Adw.Bin):
-    def __init__(self, component_content: str, component_type: ComponentType, *args, **kwargs):
+    """
+    Displays a `ParsedComponent`, it can be bound to different
+    ones, so that it can be reused.
+    """
+    def __init__(self, *args, **kwargs):
         Adw.Bin.__init__(self, *args, **kwargs)
         self.app = Gio.Application.get_default()
-        self.component_type = component_type
-        self._raw_component_content = component_content
-        # Exports are based on non-sescaped, non-processed content
+        self.component_type = None
+        self.exports = []
+
+        self._text_label = Gtk.Label(
+            wrap=True,
+            wrap_mode=Pango.WrapMode.WORD_CHAR,
+            selectable=True,
+            xalign=0.0
+        )
+        self.set_child(self._text_label)
+
+    def bind(self, parsed_component: ParsedComponent):
+        self.component_type = parsed_component.component_type
         self.exports = _generate_exports(
-            self._raw_component_content,
-            include_links=self.app.confman.get_value("preview_links")
+            parsed_component.links,
+            include_links=self.app.confman.get_value("preview_links"),
+            preview_cache=parsed_component.link_previews
         )
 
         if self.component_type in [ComponentType.STANDARD, ComponentType.QUOTE]:
-            self._text_label = Gtk.Label(
-                wrap=True,
-                wrap_mode=Pango.WrapMode.WORD_CHAR,
-                selectable=True,
-                xalign=0.0
-            )
-            # Safe currently as only strings
-            self._text_label.set_markup("".join(build_widget_list(self._raw_component_content)))
+            self._text_label.set_markup(parsed_component.markup)
 
             if self.component_type == ComponentType.QUOTE:
                 self._text_label.add_css_class("quote")
-
-            self.set_child(self._text_label)
+            else:
+                self._text_label.remove_css_class("quote")
+
+    def unbind(self):
+        self.component_type = None
+        # Owned by the message widget once added
+        self.exports = []
+        self._text_label.set_label("")
@@ -0,0 +1,225 @@
+# Copyright 2021 Raidro Manchester
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import sqlite3
+import threading
+import discord
+from pathlib import Path
+
+
+def _user_to_payload(user: discord.abc.User) -> dict:
+    return {
+        "id": str(user.id),
+        "username": user.name,
+        "discriminator": user.discriminator,
+        "avatar": user.avatar,
+        "bot": user.bot
+    }
+
+
+def message_to_payload(message: discord.Message) -> dict:
+    """
+    Convert a message back into the data discord sent for it, as much as
+    is needed to create an equal `discord.Message` again with `payload_to_message`.
+
+    param:
+        message: the `discord.Message`
+    returns:
+        json serializable dict
+    """
+    return {
+        "id": str(message.id),
+        "channel_id": str(message.channel.id),
+        "type": message.type.value,
+        "content": message.content,
+        "edited_timestamp": message.edited_at.isoformat() if message.edited_at else None,
+        "pinned": message.pinned,
+        "tts": message.tts,
+        "mention_everyone": message.mention_everyone,
+        "flags": message.flags.value,
+        "author": _user_to_payload(message.author),
+        "mentions": [_user_to_payload(user) for user in message.mentions],
+        "mention_roles": [str(role_id) for role_id in message.raw_role_mentions],
+        "attachments": [
+            {
+                "id": str(attachment.id),
+                "filename": attachment.filename,
+                "size": attachment.size,
+                "url": attachment.url,
+                "proxy_url": attachment.proxy_url,
+                "width": attachment.width,
+                "height": attachment.height,
+                "content_type": attachment.content_type
+            }
+            for attachment in message.attachments
+        ],
+        "embeds": [embed.to_dict() for embed in message.embeds]
+    }
+
+
+def payload_to_message(channel: discord.TextChannel, payload: dict) -> discord.Message:
+    """
+    Create a `discord.Message` from data of `message_to_payload`.
+
+    NOTE: this adds the author to the user cache of the client, so it must
+    run on the discord thread.
+
+    param:
+        channel: the channel of the message
+        payload: the data
+    """
+    return discord.Message(state=channel._state, channel=channel, data=payload)
+
+
+class MessageStore:
+    """
+    An on disk store of the latest messages of channels, so that opening a
+    channel can show them immediately, while the latest page is fetched.
+
+    The messages of a channel in the store should always be a range without
+    gaps, so only store messages that are next to ones that already are, or
+    a latest page (`latest` of `store_messages`).
+
+    Methods block on disk access, use them in TaskCategory.IO tasks. They
+    can be used from any thread.
+    """
+    # More than anyone scrolls through without the view loading from
+    # the network anyways
+    MAX_MESSAGES_PER_CHANNEL = 500
+
+    def __init__(self, path: Path = None):
+        """
+        Create a MessageStore
+
+        param:
+            path: (optional) override the default path
+        """
+        if path is None:
+            path = Path(os.environ["XDG_DATA_HOME"]) / "mirdorph" / "messages.db"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages "
+                "(id INTEGER PRIMARY KEY, channel_id INTEGER NOT NULL, payload TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel_id, id)"
+            )
+
+    def store_messages(self, channel_id: int, payloads: list, latest=False):
+        """
+        Store messages of a channel, replacing ones with the same id.
+
+        param:
+            channel_id: the id of the channel
+            payloads: list of dicts from `message_to_payload`
+            latest: if these are the latest messages of the channel. If
+            they are all newer than the stored ones, those are dropped, as
+            there could be missing messages in between.
+        """
+        if not payloads:
+            return
+        ids = [int(payload["id"]) for payload in payloads]
+        with self._lock, self._connection:
+            if latest:
+                newest_id, = self._connection.execute(
+                    "SELECT MAX(id) FROM messages WHERE channel_id = ?",
+                    (channel_id,)
+                ).fetchone()
+                if newest_id is not None and min(ids) > newest_id:
+                    self._connection.execute(
+                        "DELETE FROM messages WHERE channel_id = ?",
+                        (channel_id,)
+                    )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO messages (id, channel_id, payload) VALUES (?, ?, ?)",
+                [
+                    (message_id, channel_id, json.dumps(payload, separators=(",", ":")))
+                    for message_id, payload in zip(ids, payloads)
+                ]
+            )
+            self._connection.execute(
+                "DELETE FROM messages WHERE channel_id = ? AND id < ("
+                "SELECT id FROM messages WHERE channel_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (channel_id, channel_id, self.MAX_MESSAGES_PER_CHANNEL - 1)
+            )
+
+    def get_latest_messages(self, channel_id: int, limit: int) -> list:
+        """
+        Get the newest stored messages of a channel.
+
+        param:
+            channel_id: the id of the channel
+            limit: how many messages to get at most
+        returns:
+            list of dicts from `message_to_payload`, newest first like
+            discord history
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT payload FROM messages WHERE channel_id = ? ORDER BY id DESC LIMIT ?",
+                (channel_id, limit)
+            ).fetchall()
+        return [json.loads(payload) for payload, in rows]
+
+    def update_message(self, message_id: int, changes: dict):
+        """
+        Update a stored message, for example after it was edited. Nothing
+        happens if it isn't stored.
+
+        param:
+            message_id: the id of the message
+            changes: the fields of the data to change, like those of
+            `message_to_payload`
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT payload FROM messages WHERE id = ?",
+                (message_id,)
+            ).fetchone()
+            if row is None:
+                return
+            payload = json.loads(row[0])
+            payload.update(changes)
+            self._connection.execute(
+                "UPDATE messages SET payload = ? WHERE id = ?",
+                (json.dumps(payload, separators=(",", ":")), message_id)
+            )
+
+    def delete_messages(self, message_ids: list):
+        """
+        Delete messages, ones that aren't stored are ignored.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM messages WHERE id = ?",
+                [(message_id,) for message_id in message_ids]
+            )
+
+    def clear(self):
+        """
+        Delete all stored messages, for example when logging out.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM messages")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
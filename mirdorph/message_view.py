@@ -15,14 +15,17 @@
 
 import asyncio
 import logging
-import threading
 import discord
 import datetime
 import sys
 from gi.repository import Adw, Gtk, Gio, GObject, GLib
 from .event_receiver import EventReceiver
 from .message import MessageWidget, MessageMobject
+from .message_list_model import MessageListModel
+from .history_prefetcher import HistoryPrefetcher
+from .message_store import message_to_payload, payload_to_message
 from .typing_indicator import TypingIndicator
+from .scheduler import CancellationScope, TaskCategory
 
 
 # From clutter-easing.c, based on Robert Penner's
@@ -52,39 +55,40 @@ class MessageView(Gtk.Overlay, EventReceiver):
 
     def __init__(self, context, *args, **kwargs):
         Gtk.Overlay.__init__(self, *args, **kwargs)
-        EventReceiver.__init__(self)
+        EventReceiver.__init__(self, channel_id=context.channel_id)
         self.context = context
         self.app = Gio.Application.get_default()
         # After first populating the listview, we appear at the top of the history,
         # not the bottom
         self._first_load = True
-
-        # NOTE: this model is the main model that supports appending and simillar,
-        # however it isn't sorted. For use that requires the order to be correct,
-        # use _sorted_model
-        self._model = Gio.ListStore()
-        def data_sort_func(first: MessageMobject, second: MessageMobject, user_data):
-            if first.created_at < second.created_at:
-                return -1
-            elif first.created_at > second.created_at:
-                return 1
-            else:
-                return 0
-        self._sorted_model = Gtk.SortListModel(
-            model=self._model,
-            sorter=Gtk.CustomSorter.new(data_sort_func)
-        )
-
-        # It is not simple to set a header widget of a listmodel, so instead we have
-        # a flattened model containing the header model and then our real model.
-        # The message Mobject also needs to be adapted to support this functionality
+        # If events were lost while history was already loading, the latest
+        # messages have to be loaded again after it is done.
+        self._resync_pending = False
+        # If the newest messages were evicted, so the model doesn't reach
+        # the present anymore, see `_evict_messages`.
+        self._newer_evicted = False
+        # New messages that arrived while the messages leading up to them
+        # were being loaded again.
+        self._held_back_messages = []
+        # The first history load shows the messages of the message store,
+        # only the newer ones are fetched afterwards.
+        self._tried_message_store = False
+        # If the loaded messages were started around a scroll anchor, then
+        # they aren't stored until the present is reached, as they could
+        # leave a gap in the store.
+        self._anchored = False
+        # Decides when to load older history while scrolling up
+        self.prefetcher = HistoryPrefetcher()
+        # History loading, cancelled on teardown
+        self._scope = CancellationScope()
+
+        # Sorted by message id, with the header widget at position 0.
+        # The message Mobject also needs to be adapted to support the header
         # as all items must be of the same type
-        self._header_model = Gio.ListStore()
-        self._header_model.append(MessageMobject(None, is_header=True))
-        model_list = Gio.ListStore()
-        model_list.append(self._header_model)
-        model_list.append(self._sorted_model)
-        flattened_abstraction_model = Gtk.FlattenListModel.new(model_list)
+        self._model = MessageListModel(MessageMobject(None, is_header=True))
+        # Message id -> its mobject in _model, must always be kept in sync with it.
+        # Finding a message by scanning the model gets slow with a lot of history.
+        self._mobjects_by_id = {}
 
         self._factory = Gtk.SignalListItemFactory()
         self._factory.connect("setup", self._data_setup)
@@ -92,7 +96,7 @@ class MessageView(Gtk.Overlay, EventReceiver):
         self._factory.connect("unbind", self._data_unbind)
         self._factory.connect("teardown", self._data_teardown)
 
-        self._listview.set_model(Gtk.NoSelection.new(flattened_abstraction_model))
+        self._listview.set_model(Gtk.NoSelection.new(self._model))
         self._listview.set_factory(self._factory)
 
         self._typing_indicator = TypingIndicator(self.context.channel_disc)
@@ -132,25 +136,45 @@ class MessageView(Gtk.Overlay, EventReceiver):
     def _data_teardown(self, factor, listitem: Gtk.ListItem):
         listitem.set_child(None)
 
-    def _fix_merges(self):
+    def _fix_merge_at(self, index: int):
+        """
+        Make the merged state of the mobject at an index of the model
+        correct, it only depends on the message right before it.
+
+        param:
+            index: the message index, it is fine if it is out of range
+        """
+        mobject = self._model.get_message(index)
+        if mobject is None:
+            return
+        should_be_merged = False
+        if index > 0:
+            should_be_merged = (self._model.get_message(index - 1).author == mobject.author)
+        # Only when changed, every change rebinds the row
+        if mobject.get_property("merged") != should_be_merged:
+            mobject.set_property("merged", should_be_merged)
+
+    def _fix_merges_around(self, mobjects: list):
         """
-        Attempt to efficiently fix incorrect message merging,
-        this only affects in correct mobjects and only itterates
-        through the liststore once.
+        Fix incorrect message merging after inserting mobjects.
+
+        Only the inserted mobjects and the ones right after them can be wrong,
+        so the rest of the model isn't touched.
 
         It is needed because it is extremely hard to handle cross-load
-        merging in `self._load_messages`, and this was the best solution
-        that I found.
+        merging in `self._load_messages`.
+
+        param:
+            mobjects: list of the inserted `MessageMobject`s
         """
-        previous_mobject = None
-        for mobject in self._sorted_model:
-            if not previous_mobject:
-                if mobject.get_property("merged"):
-                    mobject.set_property("merged", False)
-            elif previous_mobject.author == mobject.author:
-                if not mobject.get_property("merged"):
-                    mobject.set_property("merged", True)
-            previous_mobject = mobject
+        indexes = set()
+        for mobject in mobjects:
+            index = self._model.index_of(mobject.id)
+            if index != -1:
+                indexes.add(index)
+                indexes.add(index + 1)
+        for index in sorted(indexes):
+            self._fix_merge_at(index)
 
     def filter_messages_dupes(self, messages: list) -> list:
         """
@@ -161,13 +185,18 @@ class MessageView(Gtk.Overlay, EventReceiver):
         returns:
             a list of `discord.Message` that is not duplicated
         """
-        ids = [message.id for message in messages]
-        dupe_ids = []
-        for item in self._model:
-            if item.id in ids:
-                dupe_ids.append(item.id)
+        return [message for message in messages if message.id not in self._mobjects_by_id]
 
-        return [message for message in messages if message.id not in dupe_ids]
+    def get_mobject(self, message_id: int) -> MessageMobject:
+        """
+        Get the mobject of a loaded message.
+
+        param:
+            message_id: the id of the message
+        returns:
+            the `MessageMobject`, or None if the message isn't loaded
+        """
+        return self._mobjects_by_id.get(message_id)
 
     def _load_messages(self, messages: list):
         """
@@ -180,19 +209,8 @@ class MessageView(Gtk.Overlay, EventReceiver):
         """
         messages = self.filter_messages_dupes(messages)
         # Fallback, needed for merging
-        messages.sort(key=lambda x : x.created_at)
-
-        # Performance issue of adding to the liststore. I don't understand why,
-        # and it isn't creating the objects that takes a while, but adding them.
-        # Sorting on or off doesn't matter.
-        # However using splice instead of insert/append after creating every one
-        # significantly reduces the performance hit.
-        # I asked on IRC and was asked to profile, but I couldn't get that to work.
-        # Sysprof even after installing all the debug symbols and stuff showed most
-        # time spent in /app/bin/mirdorph, and then libgtk4. However the functions
-        # themselves in libgtk4 were basically 0%, so I don't understand.
-        # Python cProfile also useless, but alteast I am 100% sure the cause for the
-        # slowdown is adding to the liststore.
+        messages.sort(key=lambda x : x.id)
+
         message_widgets = []
 
         previous_author = None
@@ -209,10 +227,10 @@ class MessageView(Gtk.Overlay, EventReceiver):
             # https://gitlab.gnome.org/GNOME/fractal/-/issues/231
             # we work around it ;)
             elif len(messages) == 1:
-                number_of = self._model.get_n_items()
+                number_of = self._model.get_n_messages()
                 if number_of > 0:
-                    last_mobject: MessageMobject = self._sorted_model.get_item(number_of - 1)
-                    if message.created_at > last_mobject.created_at:
+                    last_mobject: MessageMobject = self._model.get_message(number_of - 1)
+                    if message.id > last_mobject.id:
                         # The message here can be from anywhere, we want to avoid
                         # blindly assuming it will be the latest message.
                         should_be_merged = (message.author == last_mobject.author)
@@ -222,15 +240,66 @@ class MessageView(Gtk.Overlay, EventReceiver):
 
         # Workaround: https://gitlab.gnome.org/GNOME/gtk/merge_requests/395
         self.scroller.set_kinetic_scrolling(False)
-        self._model.splice(0, 0, message_widgets)
+        # Inserting many at once is a lot faster than one by one, as messages
+        # next to each other are added with a single items-changed.
+        self._model.insert(message_widgets)
+        for mobject in message_widgets:
+            self._mobjects_by_id[mobject.id] = mobject
         if self._first_load:
             GLib.idle_add(self.context.scroll_messages_to_bottom)
 
-        if messages:
-            self._fix_merges()
+        if message_widgets:
+            self._fix_merges_around(message_widgets)
 
         self._first_load = False
 
+    def _get_max_loaded_messages(self) -> int:
+        # Too small and loading a page would evict what is being looked at
+        return max(
+            self.app.confman.get_value("max_loaded_messages"),
+            self._STANDARD_HISTORY_LOADING * 3
+        )
+
+    def _evict_messages(self, newest: bool):
+        """
+        Drop messages once more than the maximum are loaded, so memory
+        doesn't keep growing when scrolling through a lot of history.
+        They are loaded again when scrolling back to them.
+
+        param:
+            newest: if the newest messages should be dropped (after loading
+            older ones, the view is at the top) instead of the oldest
+        """
+        excess = self._model.get_n_messages() - self._get_max_loaded_messages()
+        if excess <= 0:
+            return
+
+        if newest:
+            removed = self._model.remove_range(self._model.get_n_messages() - excess, excess)
+            self._newer_evicted = True
+        else:
+            removed = self._model.remove_range(0, excess)
+            # The first message has nothing to be merged with anymore
+            self._fix_merge_at(0)
+        for mobject in removed:
+            del self._mobjects_by_id[mobject.id]
+            mobject.discard()
+
+    def _jump_to_present(self):
+        """
+        Drop all loaded messages and load the latest ones again, for when
+        the newest messages were evicted but are needed now.
+        """
+        if self.props.loading_history:
+            return
+        for mobject in self._model.remove_all():
+            mobject.discard()
+        self._mobjects_by_id.clear()
+        self._newer_evicted = False
+        self._anchored = False
+        self._first_load = True
+        self.load_history()
+
     def _on_upper_changed(self, upper: float, adjparam):
         self.scroller.set_kinetic_scrolling(True)
         if self._autoscroll:
@@ -242,10 +311,27 @@ class MessageView(Gtk.Overlay, EventReceiver):
         self._autoscroll = self.context.is_scroll_at_bottom
         self._scroll_btn_revealer.set_reveal_child(not self.context.is_scroll_at_bottom)
 
-        # Near top of loaded history
-        if adj.get_value() < adj.get_page_size() * 2:
+        # Older history, early enough that it is there before reaching the top
+        amount_to_load = self.prefetcher.update(
+            adj.get_value(),
+            adj.get_page_size(),
+            adj.get_upper(),
+            self._model.get_n_messages()
+        )
+        if amount_to_load:
+            if not self.props.loading_history:
+                self.load_history(additional=amount_to_load)
+        # Near bottom of loaded history, but newer messages were evicted
+        elif self._newer_evicted and adj.get_value() > adj.get_upper() - adj.get_page_size() * 3:
             if not self.props.loading_history:
-                self.load_history(additional=30)
+                n_messages = self._model.get_n_messages()
+                self.load_history(
+                    additional=self.prefetcher.get_page_size(
+                        adj.get_page_size(),
+                        adj.get_upper() / n_messages if n_messages else 0
+                    ),
+                    newer=True
+                )
 
     ### Smooth scroll animation code taken from Fractal, but converted from rust to Python
     ### Also, I basically know zero Rust ###
@@ -265,6 +351,11 @@ class MessageView(Gtk.Overlay, EventReceiver):
     @Gtk.Template.Callback()
     def _on_scroll_btn_clicked(self, button):
         self._scroll_btn_revealer.set_reveal_child(False)
+        if self._newer_evicted:
+            # The bottom isn't the present, scrolling through everything that
+            # was evicted would be pointless.
+            self._jump_to_present()
+            return
         clock = self.scroller.get_frame_clock()
         duration = 200
         start = self._adj.get_value()
@@ -277,20 +368,135 @@ class MessageView(Gtk.Overlay, EventReceiver):
             start
         )
 
-    def disc_on_message(self, message):
-        if message.channel.id == self.context.channel_id:
-            self._load_messages([message])
+    def _store_messages(self, messages: list, latest=False):
+        """
+        Add messages to the message store of the application in the background,
+        see `MessageStore.store_messages`.
+        """
+        if not messages or self._anchored:
+            return
+        payloads = [message_to_payload(message) for message in messages]
+        self.app.scheduler.submit(
+            TaskCategory.IO,
+            self.app.message_store.store_messages,
+            self.context.channel_id,
+            payloads,
+            latest=latest
+        )
 
+    def disc_on_message(self, message):
+        if self._newer_evicted:
+            # It would be disconnected from the loaded messages, it is
+            # loaded with them when scrolling down instead.
+            if self.props.loading_history:
+                self._held_back_messages.append(message)
             if self.context.scroll_for_msg_send:
-                GLib.idle_add(self.context.scroll_messages_to_bottom)
+                self.context.scroll_for_msg_send = False
+                self._jump_to_present()
+            return
+
+        self._load_messages([message])
+        self._store_messages([message])
+        # Otherwise a view left open at the bottom of a busy channel grows
+        # forever. Not while a page is loading, it would leave a gap in front
+        # of it, and not while reading older messages, those would disappear.
+        if self.context.is_scroll_at_bottom and not self.props.loading_history:
+            self._evict_messages(newest=False)
+
+        if self.context.scroll_for_msg_send:
+            GLib.idle_add(self.context.scroll_messages_to_bottom)
+
+        # We unset it here since currently it always intended for one message - the next one
+        # And it is extremely unlikely that the next on_message isn't the one that has been sent.
+        # This isnt called in the async send msg function with GLib.idle_add because it for some
+        # reason executes in the wrong order then and misses the message.
+        self.context.scroll_for_msg_send = False
+
+    def disc_on_message_edit(self, before, after):
+        mobject = self.get_mobject(after.id)
+        if mobject is not None:
+            mobject.update_message(after)
+            self._model.update(after.id)
+        self.app.scheduler.submit(
+            TaskCategory.IO,
+            self.app.message_store.update_message,
+            after.id,
+            message_to_payload(after)
+        )
+
+    def disc_on_raw_message_edit(self, payload):
+        # Then it is also dispatched as on_message_edit, with the full message
+        if payload.cached_message is not None:
+            return
+        # Edits without content are for example embeds of links appearing
+        if "content" not in payload.data:
+            return
+
+        edited_at = discord.utils.parse_time(payload.data.get("edited_timestamp"))
+        mobject = self.get_mobject(payload.message_id)
+        if mobject is not None:
+            mobject.update_content(payload.data["content"], edited_at)
+            self._model.update(payload.message_id)
+        self.app.scheduler.submit(
+            TaskCategory.IO,
+            self.app.message_store.update_message,
+            payload.message_id,
+            {
+                key: payload.data[key]
+                for key in ("content", "edited_timestamp", "embeds")
+                if key in payload.data
+            }
+        )
+
+    def _remove_messages(self, message_ids: set):
+        """
+        Remove deleted messages, fixing the merging of the ones after them.
+
+        param:
+            message_ids: set of the ids, ones that aren't loaded are ignored
+        """
+        self.app.scheduler.submit(
+            TaskCategory.IO,
+            self.app.message_store.delete_messages,
+            list(message_ids)
+        )
 
-            # We unset it here since currently it always intended for one message - the next one
-            # And it is extremely unlikely that the next on_message isn't the one that has been sent.
-            # This isnt called in the async send msg function with GLib.idle_add because it for some
-            # reason executes in the wrong order then and misses the message.
-            self.context.scroll_for_msg_send = False
+        # Only the first message after a removed one can change merging
+        followers = []
+        for message_id in message_ids:
+            index = self._model.index_of(message_id)
+            if index == -1:
+                continue
+            follower = self._model.get_message(index + 1)
+            if follower is not None and follower.id not in message_ids:
+                followers.append(follower)
+
+        for mobject in self._model.remove_ids(message_ids):
+            del self._mobjects_by_id[mobject.id]
+            mobject.discard()
+        for follower in followers:
+            self._fix_merge_at(self._model.index_of(follower.id))
+
+    # The raw events are used, as they are dispatched even for messages that
+    # discord.py doesn't have anymore.
+    def disc_on_raw_message_delete(self, payload):
+        self._remove_messages({payload.message_id})
+
+    def disc_on_raw_bulk_message_delete(self, payload):
+        self._remove_messages(set(payload.message_ids))
+
+    def disc_on_resync_needed(self):
+        # Messages may be missing, loading the latest history again fills
+        # the gap at the bottom, duplicates are filtered.
+        if self._newer_evicted:
+            # They will be loaded when scrolling to the bottom anyways
+            return
+        if self.props.loading_history:
+            self._resync_pending = True
+        else:
+            self.load_history()
 
-    async def _get_history_messages_to_list(self, channel: discord.TextChannel, amount_to_load: int, before: datetime.datetime=None) -> list:
+    async def _get_history_messages_to_list(self, channel: discord.TextChannel, amount_to_load: int, before: datetime.datetime=None, after: datetime.datetime=None, around: int=None) -> list:
         """
         Return a list of Discord messages in current history,
         useful to call in other thread and use the list to build
@@ -300,40 +506,158 @@ class MessageView(Gtk.Overlay, EventReceiver):
             channel: the discord channel
             amount_to_load: how many messages you want to get,
             before: if it exists, before which message to load
+            after: if it exists, after which message to load, the
+            ones right after it
+            around: if it exists, the id of the message to load the
+            messages around
         """
         if before:
             messages = await channel.history(limit=amount_to_load, before=before).flatten()
+        elif after:
+            messages = await channel.history(limit=amount_to_load, after=after).flatten()
+        elif around:
+            messages = await channel.history(limit=amount_to_load, around=discord.Object(id=around)).flatten()
         else:
             messages = await channel.history(limit=amount_to_load).flatten()
         return messages
 
-    def _history_loading_gtk_target(self, messages: list):
+    async def _get_stored_messages(self, channel: discord.TextChannel, amount_to_load: int) -> list:
+        """
+        Like `_get_history_messages_to_list`, but the latest messages of the
+        message store instead of discord.
+        """
+        payloads = await asyncio.wrap_future(self.app.scheduler.submit(
+            TaskCategory.IO,
+            self.app.message_store.get_latest_messages,
+            channel.id,
+            amount_to_load
+        ))
+        return [payload_to_message(channel, payload) for payload in payloads]
+
+    def _stored_history_loading_gtk_target(self, messages: list):
+        if not messages:
+            self.props.loading_history = False
+            # Nothing stored, new messages are part of the latest history
+            self._newer_evicted = False
+            self._held_back_messages.clear()
+            self.load_history()
+            return
+
         self._load_messages(messages)
+        # The stored messages end somewhere in the past and may have been
+        # edited or deleted since, the latest page is compared with them.
+        amount_to_load = self._STANDARD_HISTORY_LOADING
+        self._scope.run_on_discord(
+            self._get_history_messages_to_list(self.context.channel_disc, amount_to_load),
+            callback=lambda latest_messages : self._latest_history_loading_gtk_target(
+                latest_messages,
+                amount_to_load
+            ),
+            error_callback=self._history_loading_error_gtk_target
+        )
+
+    def _latest_history_loading_gtk_target(self, messages: list, amount_to_load: int):
+        """
+        Load the latest page of history after stored messages were shown,
+        removing the stored ones that were deleted in the meantime.
+        """
+        page_ids = {message.id for message in messages}
+        loaded_ids = set(self._mobjects_by_id)
+        if len(messages) < amount_to_load:
+            # The page is the whole channel
+            deleted_ids = loaded_ids - page_ids
+        elif loaded_ids and min(page_ids) <= max(loaded_ids):
+            # Only the ones in the range of the page can be checked
+            deleted_ids = {
+                message_id for message_id in loaded_ids
+                if message_id >= min(page_ids)
+            } - page_ids
+        else:
+            # More new messages than fit in a page, the stored ones aren't
+            # connected to them. Storing the page as latest drops them.
+            deleted_ids = set()
+            for mobject in self._model.remove_all():
+                mobject.discard()
+            self._mobjects_by_id.clear()
+            self._first_load = True
+        if deleted_ids:
+            self._remove_messages(deleted_ids)
 
+        for message in messages:
+            mobject = self._mobjects_by_id.get(message.id)
+            if mobject is not None and mobject.edited_at != message.edited_at:
+                mobject.update_message(message)
+                self._model.update(message.id)
+
+        # Up to the present now
+        self._newer_evicted = False
+        self._anchored = False
+        self._history_loading_gtk_target(messages + self._held_back_messages)
+
+    def _stored_history_loading_error_gtk_target(self, error: Exception):
+        logging.error("failed to load stored messages", exc_info=error)
+        self._newer_evicted = False
+        self._held_back_messages.clear()
         self.props.loading_history = False
+        self.load_history()
 
-    def _history_loading_target(self, additional: None, before: None):
-        # Additional is only there if we want to "add" to the history,
-        # and before is also only if we want to "add" to the history,
-        # not start from scratch. Which is why we have to change the amount
-        # passed to the getting messages history function.
-        if before:
-            amount_to_load = additional
-        else:
-            amount_to_load = self._STANDARD_HISTORY_LOADING
+    def _history_loading_gtk_target(self, messages: list, older=False, newer=False, amount_to_load=0, anchor=None):
+        self._load_messages(messages)
+        if older:
+            self.prefetcher.load_finished()
+
+        if anchor is not None:
+            # Not necessarily up to the present, found out by scrolling down
+            self._newer_evicted = True
+            self._anchored = True
+            GLib.idle_add(self._scroll_to_message, anchor)
+
+        if newer and len(messages) < amount_to_load:
+            # Reached the present again
+            self._newer_evicted = False
+            self._anchored = False
+            self._load_messages(self._held_back_messages)
+            self._store_messages(messages + self._held_back_messages, latest=True)
+        elif anchor is None:
+            self._store_messages(messages, latest=not (older or newer))
+        # Evict on the other side of where was loaded, away from the viewport
+        self._evict_messages(newest=older)
+        self._held_back_messages.clear()
 
-        messages = asyncio.run_coroutine_threadsafe(
-            self._get_history_messages_to_list(
-                self.context.channel_disc,
-                amount_to_load,
-                before=before
-            ),
-            self.app.discord_loop
-        ).result()
+        self.props.loading_history = False
 
-        GLib.idle_add(self._history_loading_gtk_target, messages)
+        if self._resync_pending and not self._newer_evicted:
+            self._resync_pending = False
+            self.load_history()
+
+    def _history_loading_error_gtk_target(self, error: Exception):
+        logging.error("failed to load history", exc_info=error)
+        self.prefetcher.load_finished(succeeded=False)
+        # Otherwise it would be stuck loading forever
+        self.props.loading_history = False
 
-    def load_history(self, additional=None):
+    def get_scroll_anchor(self) -> int:
+        """
+        Get the message at about the top of the viewport, to restore the
+        scroll position later with `load_history(anchor=...)`.
+
+        returns:
+            the id of the message, or None if scrolled to the bottom
+        """
+        n_messages = self._model.get_n_messages()
+        if not n_messages or self._adj.get_upper() <= 0 or self.context.is_scroll_at_bottom:
+            return None
+        # Rows aren't all the same height, but it is close enough
+        index = int(self._adj.get_value() / self._adj.get_upper() * n_messages)
+        return self._model.get_message(min(index, n_messages - 1)).id
+
+    def _scroll_to_message(self, message_id: int):
+        # The same approximation as in get_scroll_anchor
+        index = self._model.index_of(message_id)
+        if index != -1:
+            self._adj.set_value(self._adj.get_upper() * index / self._model.get_n_messages())
+
+    def load_history(self, additional=None, newer=False, anchor=None):
         """
         Load the history of the view and it's channel
 
@@ -342,15 +666,86 @@ class MessageView(Gtk.Overlay, EventReceiver):
         param:
             additional - additional ammount of messages to load, useful
             only if previously loaded, for example more history when scrolling.
+            newer - load the messages after the newest loaded one instead of
+            older ones, with additional. Only makes sense if the newest ones
+            were evicted.
+            anchor - load the messages around the message with this id
+            and scroll to it, instead of the latest ones.
         """
         if self.props.loading_history:
             logging.warning("attempted to load history even if already loading")
             return
+        if not additional and anchor is None and self._newer_evicted:
+            # The latest messages would leave a gap, the newer ones are
+            # loaded when scrolling down instead.
+            return
         self.props.loading_history = True
+
+        if not additional and anchor is None and not self._tried_message_store:
+            self._tried_message_store = True
+            if not self._model.get_n_messages():
+                # Until the stored messages are caught up with the present,
+                # new ones are held back.
+                self._newer_evicted = True
+                self._scope.run_on_discord(
+                    self._get_stored_messages(self.context.channel_disc, self._STANDARD_HISTORY_LOADING),
+                    callback=self._stored_history_loading_gtk_target,
+                    error_callback=self._stored_history_loading_error_gtk_target
+                )
+                return
+
         # Better to get here to avoid GLib.ilde_add, as the model can only be used
         # on the main thread.
-        if additional:
-            before = self._sorted_model.get_item(0).created_at
+        before = None
+        after = None
+        n_messages = self._model.get_n_messages()
+        if additional and n_messages and newer:
+            after = self._model.get_message(n_messages - 1).created_at
+        elif additional and n_messages:
+            before = self._model.get_message(0).created_at
+
+        # Additional is only there if we want to "add" to the history,
+        # and before is also only if we want to "add" to the history,
+        # not start from scratch. Which is why we have to change the amount
+        # passed to the getting messages history function.
+        if before or after:
+            amount_to_load = additional
+            anchor = None
+            if before:
+                self.prefetcher.load_started()
         else:
-            before = None
-        threading.Thread(target=self._history_loading_target, args=(additional, before,)).start()
+            amount_to_load = self._STANDARD_HISTORY_LOADING
+        if anchor is not None:
+            # Not the bottom that has to be scrolled to
+            self._first_load = False
+
+        self._scope.run_on_discord(
+            self._get_history_messages_to_list(
+                self.context.channel_disc,
+                amount_to_load,
+                before=before,
+                after=after,
+                around=anchor
+            ),
+            callback=lambda messages : self._history_loading_gtk_target(
+                messages,
+                older=bool(before),
+                newer=bool(after),
+                amount_to_load=amount_to_load,
+                anchor=anchor
+            ),
+            error_callback=self._history_loading_error_gtk_target
+        )
+
+    def teardown(self):
+        """
+        Stop all background work of the view and its messages, and stop
+        receiving events. The view can't be used anymore afterwards.
+        """
+        self._scope.cancel()
+        for mobject in self._model.remove_all():
+            mobject.discard()
+        self._mobjects_by_id.clear()
+        self._held_back_messages.clear()
+        self.app.event_manager.unregister_receiver(self)
+        self.app.event_manager.unregister_receiver(self._typing_indicator)
@@ -0,0 +1,282 @@
+# Copyright 2021 Raidro Manchester
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import threading
+from enum import Enum
+from gi.repository import Gio, GLib
+
+
+class TaskCategory(Enum):
+    # Coroutines on the discord loop don't need a worker, see `run_on_discord`.
+    # Downloading avatars, images, link previews
+    NETWORK = "network"
+    # Reading and writing files, thumbnails
+    IO = "io"
+
+
+class TaskScheduler:
+    """
+    Application wide bounded worker pools for blocking work.
+
+    Instead of starting a thread per operation (which for a page of messages
+    with avatars and images meant a hundred OS threads), work is submitted
+    to a pool per `TaskCategory`, each with its own limit on how many tasks
+    run at the same time. Tasks that can't run yet wait in the pool's queue.
+
+    You need your application to have one as .scheduler
+    """
+    # Maximum number of tasks of a category running at the same time
+    CATEGORY_WORKERS = {
+        TaskCategory.NETWORK: 6,
+        TaskCategory.IO: 2
+    }
+
+    def __init__(self):
+        self._executors = {
+            category: concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix=f"mirdorph-{category.value}"
+            )
+            for category, workers in self.CATEGORY_WORKERS.items()
+        }
+        self._lock = threading.Lock()
+        # Category -> number of tasks submitted but not started yet
+        self._queued = collections.Counter()
+        # Category -> number of tasks currently running
+        self._running = collections.Counter()
+
+    def _run_task(self, category: TaskCategory, func, args: tuple, kwargs: dict):
+        with self._lock:
+            self._queued[category] -= 1
+            self._running[category] += 1
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            # Futures keep exceptions to themselves, and most callers don't
+            # look at the result, with plain threads they were at least printed.
+            logging.exception(f"error in {category.value} task {func.__qualname__}")
+            raise
+        finally:
+            with self._lock:
+                self._running[category] -= 1
+
+    def submit(self, category: TaskCategory, func, *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Run a function on a worker of a category.
+
+        param:
+            category: the `TaskCategory` of the work, decides the pool
+            func: the function to run, with args and kwargs
+        returns:
+            `concurrent.futures.Future` of the result
+        """
+        with self._lock:
+            self._queued[category] += 1
+        future = self._executors[category].submit(self._run_task, category, func, args, kwargs)
+        future.add_done_callback(lambda future : self._on_task_done(category, future))
+        return future
+
+    def _on_task_done(self, category: TaskCategory, future: concurrent.futures.Future):
+        # Futures can only be cancelled before they start, then _run_task
+        # never runs and doesn't take them off the queue.
+        if future.cancelled():
+            with self._lock:
+                self._queued[category] -= 1
+
+    def get_queue_depth(self, category: TaskCategory = None) -> int:
+        """
+        Get how many tasks are waiting for a free worker.
+
+        param:
+            category: only count this category, all if None
+        """
+        with self._lock:
+            if category is not None:
+                return self._queued[category]
+            return sum(self._queued.values())
+
+    def get_stats(self) -> dict:
+        """
+        Get the queued and running tasks of every category, for debugging.
+
+        returns:
+            dict of category name -> dict with "queued", "running" and "workers"
+        """
+        with self._lock:
+            return {
+                category.value: {
+                    "queued": self._queued[category],
+                    "running": self._running[category],
+                    "workers": workers
+                }
+                for category, workers in self.CATEGORY_WORKERS.items()
+            }
+
+    def shutdown(self):
+        """
+        Stop accepting tasks and throw away the ones that haven't started.
+        """
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Coroutines of run_on_discord that haven't finished yet, so that background
+# work on the discord loop can yield to what the user is waiting for.
+_discord_tasks_in_flight = 0
+_discord_tasks_lock = threading.Lock()
+
+
+def get_discord_tasks_in_flight() -> int:
+    """
+    Get how many coroutines started with `run_on_discord` are still running.
+    """
+    return _discord_tasks_in_flight
+
+
+def _call_on_main_thread(func, *args):
+    func(*args)
+    return GLib.SOURCE_REMOVE
+
+
+def run_on_discord(coro, callback=None, error_callback=None) -> concurrent.futures.Future:
+    """
+    Run a coroutine on the discord loop and get its result on the GTK thread,
+    without a worker thread waiting for it in between.
+
+    Can be called from any thread.
+
+    param:
+        coro: the coroutine to run, for example channel.history(...).flatten()
+        callback: optional, called on the GTK thread with the result
+        error_callback: optional, called on the GTK thread with the exception
+        if the coroutine raised one, otherwise it is logged
+    returns:
+        `concurrent.futures.Future` of the coroutine, it can be cancelled,
+        in which case no callback is called
+    """
+    global _discord_tasks_in_flight
+    app = Gio.Application.get_default()
+    with _discord_tasks_lock:
+        _discord_tasks_in_flight += 1
+    future = asyncio.run_coroutine_threadsafe(coro, app.discord_loop)
+
+    def on_done(future: concurrent.futures.Future):
+        global _discord_tasks_in_flight
+        # Runs on the discord thread
+        with _discord_tasks_lock:
+            _discord_tasks_in_flight -= 1
+        if future.cancelled():
+            return
+        exception = future.exception()
+        if exception is not None:
+            if error_callback is not None:
+                GLib.idle_add(_call_on_main_thread, error_callback, exception)
+            else:
+                logging.error(
+                    f"error in discord task {getattr(coro, '__qualname__', coro)}",
+                    exc_info=exception
+                )
+        elif callback is not None:
+            GLib.idle_add(_call_on_main_thread, callback, future.result())
+
+    future.add_done_callback(on_done)
+    return future
+
+
+class CancellationScope:
+    """
+    Background work that belongs to something with a lifetime, like a widget
+    or a mobject, so that all of it can be cancelled when that goes away.
+
+    Cancelled coroutines on the discord loop are stopped, and tasks that are
+    still waiting for a worker of the scheduler never run. Tasks that already
+    run can't be stopped, they should check `cancelled` before doing more work.
+    Callbacks given to the scope are not called anymore after cancelling.
+
+    attributes:
+        cancelled: `bool` if `cancel` was called
+    """
+    def __init__(self):
+        self.cancelled = False
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def _track(self, future: concurrent.futures.Future) -> concurrent.futures.Future:
+        with self._lock:
+            if not self.cancelled:
+                self._futures.add(future)
+        if self.cancelled:
+            future.cancel()
+        else:
+            future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future: concurrent.futures.Future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _guard(self, callback):
+        if callback is None:
+            return None
+
+        def guarded_callback(*args):
+            if not self.cancelled:
+                callback(*args)
+        return guarded_callback
+
+    def submit(self, category: TaskCategory, func, *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Like `TaskScheduler.submit` of the application's scheduler,
+        but cancelled together with the scope.
+        """
+        scheduler = Gio.Application.get_default().scheduler
+        return self._track(scheduler.submit(category, func, *args, **kwargs))
+
+    def run_on_discord(self, coro, callback=None, error_callback=None) -> concurrent.futures.Future:
+        """
+        Like `run_on_discord`, but cancelled together with the scope.
+
+        returns:
+            `concurrent.futures.Future` of the coroutine, or None if the scope
+            is already cancelled, and the coroutine wasn't started at all
+        """
+        if self.cancelled:
+            coro.close()
+            return None
+        return self._track(
+            run_on_discord(coro, self._guard(callback), self._guard(error_callback))
+        )
+
+    def idle_add(self, func, *args):
+        """
+        GLib.idle_add, but func isn't called if the scope is cancelled by then.
+        Useful to deliver results of `submit` tasks.
+        """
+        GLib.idle_add(_call_on_main_thread, self._guard(func), *args)
+
+    def cancel(self):
+        """
+        Cancel all work of the scope, and any work added later.
+        """
+        with self._lock:
+            self.cancelled = True
+            futures = list(self._futures)
+            self._futures.clear()
+        for future in futures:
+            future.cancel()
@@ -14,8 +14,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import discord
-import time
-import threading
 import datetime
 from gettext import gettext as _
 from gi.repository import Gtk, GLib
@@ -31,7 +29,7 @@ class TypingIndicator(Gtk.Revealer, EventReceiver):
 
     def __init__(self, channel: discord.channel.TextChannel, *args, **kwargs):
         Gtk.Revealer.__init__(self, *args, **kwargs)
-        EventReceiver.__init__(self)
+        EventReceiver.__init__(self, channel_id=channel.id)
         self._channel = channel
 
         self._currently_typing_users = []
@@ -39,17 +37,16 @@ class TypingIndicator(Gtk.Revealer, EventReceiver):
         # so we know when to stop displaying it.
         self._times_of_user_typings = []
 
-    def _wating_for_type_end_target(self, user: discord.User, when: datetime.datetime):
-        # Even if we wanted this to be smaller, we can't decrease it too much as discord itself
-        # only sends the typing event every so often.
-        time.sleep(10)
+    def _on_typing_timeout(self, user: discord.User, when: datetime.datetime):
+        self._times_of_user_typings.remove((user, when))
         for tims in [typing_event[1] for typing_event in self._times_of_user_typings if typing_event[0] == user]:
             if tims > when:
-                return
+                return GLib.SOURCE_REMOVE
 
         if user in self._currently_typing_users:
             self._currently_typing_users.remove(user)
-            GLib.idle_add(self._sync_typing_label)
+            self._sync_typing_label()
+        return GLib.SOURCE_REMOVE
 
     def _sync_typing_label(self):
         if self._currently_typing_users:
@@ -67,7 +64,7 @@ class TypingIndicator(Gtk.Revealer, EventReceiver):
             self._typing_label.set_label(_("Noone is typing."))
 
     def disc_on_message(self, message: discord.Message):
-        if message.channel == self._channel and message.author in self._currently_typing_users:
+        if message.author in self._currently_typing_users:
             self._currently_typing_users.remove(message.author)
             self._sync_typing_label()
 
@@ -75,9 +72,10 @@ class TypingIndicator(Gtk.Revealer, EventReceiver):
         if user == self._channel.guild.me:
             return
 
-        if channel.id == self._channel.id:
-            if user not in self._currently_typing_users:
-                self._currently_typing_users.append(user)
-                self._sync_typing_label()
-            self._times_of_user_typings.append((user, when))
-            threading.Thread(target=self._wating_for_type_end_target, args=(user, when)).start()
+        if user not in self._currently_typing_users:
+            self._currently_typing_users.append(user)
+            self._sync_typing_label()
+        self._times_of_user_typings.append((user, when))
+        # Even if we wanted this to be smaller, we can't decrease it too much as discord itself
+        # only sends the typing event every so often.
+        GLib.timeout_add_seconds(10, self._on_typing_timeout, user, when)
@@ -0,0 +1,150 @@
+# Copyright 2021 Raidro Manchester
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+import discord
+from gi.repository import Gio, GLib
+from .message import get_avatar_path
+from .message_store import message_to_payload
+from .message_view import MessageView
+from .scheduler import TaskCategory, get_discord_tasks_in_flight
+
+
+class ChannelWarmup:
+    """
+    Loads what is needed to show recently opened channels in the background
+    after connecting, so that opening them the first time is instant: their
+    latest messages into the message store, and the members and avatars of
+    the authors.
+
+    It runs on the discord loop, one request at a time with a pause in
+    between so that it doesn't use up the rate limits, and waits while
+    anything the user is waiting for is loading.
+
+    You need your application to have one as .warmup
+    """
+    # Channels remembered as recently opened
+    MAX_RECENT_CHANNELS = 20
+    # Pause before every request, in seconds
+    _REQUEST_INTERVAL = 1.0
+    # Pause after a failed request, doubled every time
+    _ERROR_BACKOFF = 5.0
+
+    def __init__(self):
+        self._future = None
+
+    def record_channel_opened(self, channel_id: int):
+        """
+        Remember that a channel was opened, the most recent ones are
+        warmed up on the next start.
+        """
+        confman = Gio.Application.get_default().confman
+        recent_channels = [
+            recent_id for recent_id in confman.get_value("recent_channels")
+            if recent_id != channel_id
+        ]
+        recent_channels.insert(0, channel_id)
+        confman.set_value("recent_channels", recent_channels[:self.MAX_RECENT_CHANNELS])
+
+    def start(self):
+        """
+        Start warming up, call this once connected. Does nothing if
+        it was already started.
+        """
+        if self._future is not None:
+            return
+        app = Gio.Application.get_default()
+        channel_ids = app.confman.get_value("recent_channels")[:app.confman.get_value("warm_up_channels")]
+        # Not run_on_discord, it would wait for itself
+        self._future = asyncio.run_coroutine_threadsafe(
+            self._warm_up(channel_ids),
+            app.discord_loop
+        )
+
+    def stop(self):
+        """
+        Stop warming up, for example before the message store is cleared.
+        """
+        if self._future is not None:
+            self._future.cancel()
+
+    async def _wait_for_turn(self):
+        await asyncio.sleep(self._REQUEST_INTERVAL)
+        # What the user is waiting for comes first
+        while get_discord_tasks_in_flight():
+            await asyncio.sleep(self._REQUEST_INTERVAL)
+
+    async def _warm_up(self, channel_ids: list):
+        app = Gio.Application.get_default()
+        backoff = self._ERROR_BACKOFF
+        for channel_id in channel_ids:
+            channel = app.discord_client.get_channel(channel_id)
+            # Deleted, or not in the guild anymore
+            if channel is None:
+                continue
+            if app.has_inner_window_context(channel_id):
+                # Already opened since starting
+                continue
+            try:
+                await self._warm_up_channel(channel)
+                backoff = self._ERROR_BACKOFF
+            except discord.errors.HTTPException as e:
+                logging.warning(f"warming up #{channel} failed: {e}")
+                await asyncio.sleep(backoff)
+                backoff *= 2
+            except Exception:
+                logging.exception(f"warming up #{channel} failed")
+        logging.info("warm up of recent channels done")
+
+    async def _warm_up_channel(self, channel: discord.TextChannel):
+        app = Gio.Application.get_default()
+        await self._wait_for_turn()
+        messages = await channel.history(limit=MessageView._STANDARD_HISTORY_LOADING).flatten()
+        await asyncio.wrap_future(app.scheduler.submit(
+            TaskCategory.IO,
+            app.message_store.store_messages,
+            channel.id,
+            [message_to_payload(message) for message in messages],
+            latest=True
+        ))
+
+        authors = {message.author.id: message.author for message in messages}
+        for author in authors.values():
+            # Those with 0000 are generally "fake" members that are invalid
+            if author.discriminator == "0000":
+                continue
+            await self._warm_up_member(channel.guild, author)
+            avatar_path = get_avatar_path(author.id)
+            if not avatar_path.is_file():
+                await self._wait_for_turn()
+                await author.avatar_url_as(size=1024, format="png").save(str(avatar_path))
+
+    async def _warm_up_member(self, guild: discord.Guild, author: discord.abc.User):
+        # The same cache MessageMobject uses for the username color
+        app = Gio.Application.get_default()
+        if author.id in app.custom_member_cache:
+            return
+        member = author if isinstance(author, discord.Member) else guild.get_member(author.id)
+        if member is None:
+            await self._wait_for_turn()
+            try:
+                member = await guild.fetch_member(author.id)
+            except discord.errors.NotFound:
+                return
+        GLib.idle_add(self._cache_member_gtk_target, member)
+
+    def _cache_member_gtk_target(self, member: discord.Member):
+        Gio.Application.get_default().custom_member_cache[member.id] = member
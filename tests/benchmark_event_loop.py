@@ -0,0 +1,121 @@
+"""
+Compare the default two thread model (discord loop on the main thread, GTK
+main loop on another) with the single thread mode (MIRDORPH_SINGLE_THREAD,
+asyncio running on the GLib main context).
+
+Events are pushed through the event bridge from the asyncio loop, like the
+listener cog does, and the time until they are dispatched on the GTK side
+and the CPU time used are measured. From this directory:
+
+    python benchmark_event_loop.py [--events N] [--rate PER_SECOND] [--recording FILE]
+"""
+import load_gtk
+import argparse
+import asyncio
+import statistics
+import sys
+import threading
+import time
+# Workaround from stackoverflow to allow importing the program
+sys.path.append("..")
+
+from gi.repository import GLib
+from mirdorph.event_bridge import EventBridge
+from mirdorph.event_recording import read_recording
+
+
+def create_events(options) -> list:
+    """
+    returns:
+        list of (name, args) of the events to push
+    """
+    if options.recording:
+        return [(name, args) for _, name, args, _ in read_recording(options.recording)]
+    # Messages aren't coalesced, so every one of them is dispatched
+    return [("on_message", (i,)) for i in range(options.events)]
+
+
+def is_drained(bridge: EventBridge) -> bool:
+    return not (bridge.priority_lane.queue or bridge.default_lane.queue or bridge._drain_scheduled)
+
+
+async def produce(bridge: EventBridge, events: list, rate: float):
+    for name, args in events:
+        bridge.push(name, args, {})
+        if rate:
+            await asyncio.sleep(1 / rate)
+    while not is_drained(bridge):
+        await asyncio.sleep(0.001)
+
+
+def benchmark_threads(events: list, rate: float) -> tuple:
+    latencies = []
+    bridge = EventBridge(
+        lambda name, args, kwargs, enqueued_at : latencies.append(time.monotonic() - enqueued_at)
+    )
+    main_loop = GLib.MainLoop()
+    gtk_thread = threading.Thread(target=main_loop.run)
+    gtk_thread.start()
+
+    loop = asyncio.new_event_loop()
+    start_cpu_time = time.process_time()
+    start_time = time.monotonic()
+    loop.run_until_complete(produce(bridge, events, rate))
+    duration = time.monotonic() - start_time
+    cpu_time = time.process_time() - start_cpu_time
+
+    main_loop.quit()
+    gtk_thread.join()
+    loop.close()
+    return latencies, duration, cpu_time
+
+
+def benchmark_single_thread(events: list, rate: float) -> tuple:
+    try:
+        from gi.events import GLibEventLoopPolicy
+    except ImportError:
+        return None
+
+    latencies = []
+    bridge = EventBridge(
+        lambda name, args, kwargs, enqueued_at : latencies.append(time.monotonic() - enqueued_at)
+    )
+    # Runs by iterating the default GLib main context, so the idle source
+    # of the bridge is dispatched while the loop runs.
+    loop = GLibEventLoopPolicy().get_event_loop()
+    start_cpu_time = time.process_time()
+    start_time = time.monotonic()
+    loop.run_until_complete(produce(bridge, events, rate))
+    duration = time.monotonic() - start_time
+    cpu_time = time.process_time() - start_cpu_time
+    return latencies, duration, cpu_time
+
+
+def print_results(mode: str, results: tuple):
+    if results is None:
+        print(f"{mode}: not available, needs PyGObject 3.50 or newer")
+        return
+    latencies, duration, cpu_time = results
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    quantiles = statistics.quantiles(latencies_ms, n=100)
+    print(
+        f"{mode}: {len(latencies)} events dispatched in {duration:.2f}s, cpu {cpu_time:.2f}s\n"
+        f"    latency ms: mean {statistics.mean(latencies_ms):.3f}, p50 {quantiles[49]:.3f}, "
+        f"p95 {quantiles[94]:.3f}, p99 {quantiles[98]:.3f}, max {latencies_ms[-1]:.3f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the event loop models")
+    parser.add_argument("--events", type=int, default=20000, help="number of synthetic events")
+    parser.add_argument("--rate", type=float, default=0, help="events per second, 0 for a single burst")
+    parser.add_argument("--recording", help="push the events of a recording instead")
+    options = parser.parse_args()
+
+    events = create_events(options)
+    print_results("two threads", benchmark_threads(events, options.rate))
+    print_results("single thread", benchmark_single_thread(events, options.rate))
+
+
+if __name__ == "__main__":
+    main()
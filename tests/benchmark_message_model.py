@@ -0,0 +1,135 @@
+"""
+Compare the model of the message view (MessageListModel) with the stack it
+replaced: a Gio.ListStore sorted by a Gtk.SortListModel with a Python
+sort function, flattened together with a model for the header.
+
+History is loaded page by page like when scrolling up, and then single new
+messages arrive. After every change the last item is read like a list view
+would, so that lazy models can't skip their work. From this directory:
+
+    python benchmark_message_model.py [--pages N] [--page-size N] [--messages N]
+"""
+import load_gtk
+import argparse
+import datetime
+import sys
+import time
+# Workaround from stackoverflow to allow importing the program
+sys.path.append("..")
+
+from gi.repository import Gio, GObject, Gtk
+from mirdorph.message_list_model import MessageListModel
+
+# Discord ids are milliseconds since 2015 shifted by 22 bits
+_DISCORD_EPOCH = datetime.datetime(2015, 1, 1)
+
+
+class Item(GObject.Object):
+    def __init__(self, id=None):
+        GObject.Object.__init__(self)
+        self.id = id
+        if id is not None:
+            self.created_at = _DISCORD_EPOCH + datetime.timedelta(milliseconds=id >> 22)
+
+
+class SortListModelStack:
+    """
+    The models as the message view used to have them.
+    """
+    def __init__(self):
+        self.store = Gio.ListStore()
+
+        def data_sort_func(first: Item, second: Item, user_data):
+            if first.created_at < second.created_at:
+                return -1
+            elif first.created_at > second.created_at:
+                return 1
+            else:
+                return 0
+        sorted_model = Gtk.SortListModel(
+            model=self.store,
+            sorter=Gtk.CustomSorter.new(data_sort_func)
+        )
+        header_model = Gio.ListStore()
+        header_model.append(Item())
+        model_list = Gio.ListStore()
+        model_list.append(header_model)
+        model_list.append(sorted_model)
+        self.model = Gtk.FlattenListModel.new(model_list)
+
+    def insert(self, items: list):
+        self.store.splice(0, 0, items)
+
+
+class MessageListModelStack:
+    def __init__(self):
+        self.model = MessageListModel(Item())
+
+    def insert(self, items: list):
+        self.model.insert(items)
+
+
+def create_pages(options) -> tuple:
+    """
+    returns:
+        list of pages, newest first, and list of the new messages
+    """
+    # A message a second
+    ids = [(i * 1000) << 22 for i in range(options.pages * options.page_size + options.messages)]
+    history = ids[:options.pages * options.page_size]
+    pages = [
+        history[start - options.page_size:start]
+        for start in range(len(history), 0, -options.page_size)
+    ]
+    return pages, ids[len(history):]
+
+
+def run(stack_type, pages: list, messages: list) -> tuple:
+    changes = 0
+
+    def on_items_changed(model, position, removed, added):
+        nonlocal changes
+        changes += 1
+
+    stack = stack_type()
+    stack.model.connect("items-changed", on_items_changed)
+
+    start_time = time.perf_counter()
+    for page in pages:
+        # Like discord, newest first
+        stack.insert([Item(id) for id in reversed(page)])
+        stack.model.get_item(stack.model.get_n_items() - 1)
+    pages_duration = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for id in messages:
+        stack.insert([Item(id)])
+        stack.model.get_item(stack.model.get_n_items() - 1)
+    messages_duration = time.perf_counter() - start_time
+    return pages_duration, messages_duration, changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the message view models")
+    parser.add_argument("--pages", type=int, default=100, help="number of history pages")
+    parser.add_argument("--page-size", type=int, default=40, help="messages per page")
+    parser.add_argument("--messages", type=int, default=2000, help="number of single new messages")
+    options = parser.parse_args()
+
+    pages, messages = create_pages(options)
+    for name, stack_type in (
+        ("SortListModel", SortListModelStack),
+        ("MessageListModel", MessageListModelStack)
+    ):
+        pages_duration, messages_duration, changes = run(stack_type, pages, messages)
+        print(
+            f"{name}: {len(pages)} pages in {pages_duration * 1000:.1f}ms "
+            f"({pages_duration / len(pages) * 1000:.3f}ms each), "
+            f"{len(messages)} messages in {messages_duration * 1000:.1f}ms "
+            f"({messages_duration / max(len(messages), 1) * 1000:.3f}ms each), "
+            f"{changes} items-changed"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Replay a recording of gateway events through the event bridge and event
+manager, without a network connection, for benchmarking.
+
+Record a session by running Mirdorph with MIRDORPH_RECORD_EVENTS set to a
+file path, then from this directory:
+
+    python replay_events.py recording.jsonl.gz [--fast] [--channel ID] [--stats FILE]
+"""
+import load_gtk
+import argparse
+import json
+import sys
+import threading
+import time
+# Workaround from stackoverflow to allow importing the program
+sys.path.append("..")
+
+from gi.repository import Gio, GLib
+from mirdorph.event_manager import EventManager
+from mirdorph.event_receiver import EventReceiver
+from mirdorph.event_bridge import EventBridge
+from mirdorph.event_recording import read_recording
+
+
+class StubClient:
+    """
+    Stands in for the discord client, there is no connection
+    and no cogs to sync listeners with.
+    """
+    def get_cog(self, name: str):
+        return None
+
+
+def create_receiver_class(event_names) -> type:
+    """
+    Create an EventReceiver class that handles (and ignores) the given events,
+    so that every replayed event is actually dispatched to something.
+    """
+    handlers = {
+        "disc_" + name: lambda self, *args, **kwargs : None
+        for name in event_names
+    }
+    return type("ReplayReceiver", (EventReceiver,), handlers)
+
+
+def find_channel(events: list, channel_id: int):
+    for _, name, args, _ in events:
+        if name == "on_typing" and args[0].id == channel_id:
+            return args[0]
+        if name == "on_message" and args[0].channel.id == channel_id:
+            return args[0].channel
+    return None
+
+
+def feed_events(events: list, bridge: EventBridge, fast: bool, done: threading.Event):
+    start_time = time.monotonic()
+    for event_time, name, args, kwargs in events:
+        if not fast:
+            delay = event_time - (time.monotonic() - start_time)
+            if delay > 0:
+                time.sleep(delay)
+        bridge.push(name, args, kwargs)
+    done.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded gateway events")
+    parser.add_argument("recording", help="file recorded with MIRDORPH_RECORD_EVENTS")
+    parser.add_argument("--fast", action="store_true", help="don't wait between events")
+    parser.add_argument("--channel", type=int, help="show a TypingIndicator for this channel")
+    parser.add_argument("--stats", help="write the event statistics to this file")
+    options = parser.parse_args()
+
+    events = list(read_recording(options.recording))
+    print(f"loaded {len(events)} events")
+
+    app = Gio.Application(application_id="org.gnome.gitlab.ranchester.MirdorphReplay")
+    Gio.Application.set_default(app)
+    app.discord_client = StubClient()
+    app.event_manager = EventManager()
+    app.event_manager.stats.enabled = True
+
+    # Receivers are only weakly referenced, this keeps them alive until
+    # the replay is done
+    receivers = [create_receiver_class({name for _, name, _, _ in events})()]
+    if options.channel is not None:
+        from mirdorph.typing_indicator import TypingIndicator
+        channel = find_channel(events, options.channel)
+        if channel is None:
+            sys.exit(f"channel {options.channel} doesn't appear in the recording")
+        receivers.append(TypingIndicator(channel))
+
+    def forward_event(name, args, kwargs, enqueued_at):
+        app.event_manager.stats.record_latency(name, time.monotonic() - enqueued_at)
+        app.event_manager.dispatch_event(name, *args, **kwargs)
+
+    bridge = EventBridge(forward_event, app.event_manager.get_subscribed_channels)
+    main_loop = GLib.MainLoop()
+    feeding_done = threading.Event()
+
+    def check_done():
+        # Dispatching happens on this thread, so empty lanes mean that
+        # everything was dispatched.
+        if feeding_done.is_set() and not bridge.priority_lane.queue and not bridge.default_lane.queue:
+            main_loop.quit()
+            return GLib.SOURCE_REMOVE
+        return GLib.SOURCE_CONTINUE
+
+    start_time = time.monotonic()
+    threading.Thread(
+        target=feed_events,
+        args=(events, bridge, options.fast, feeding_done),
+        daemon=True
+    ).start()
+    GLib.timeout_add(50, check_done)
+    main_loop.run()
+    duration = time.monotonic() - start_time
+    del receivers
+
+    print(f"replayed {len(events)} events in {duration:.2f}s ({len(events) / duration:.0f} events/s)")
+    stats = app.event_manager.stats.to_dict(bridge)
+    if options.stats:
+        app.event_manager.stats.dump(options.stats, bridge)
+        print(f"statistics written to {options.stats}")
+    else:
+        print(json.dumps(stats["bridge"], indent=4))
+        print(json.dumps(stats["handlers"], indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import load_gtk
+import sys
+import pytest
+# Workaround from stackoverflow to allow importing the program
+sys.path.append("..")
+
+from gi.repository import GLib
+from mirdorph.event_bridge import EventBridge
+
+
+@pytest.fixture()
+def dispatched():
+    return []
+
+
+@pytest.fixture()
+def bridge(dispatched):
+    return EventBridge(lambda name, args, kwargs, enqueued_at : dispatched.append((name, args)))
+
+
+def test_drain_in_order(bridge, dispatched):
+    for i in range(200):
+        bridge.push("on_message", (i,), {})
+    while bridge._drain() == GLib.SOURCE_CONTINUE:
+        pass
+    assert dispatched == [("on_message", (i,)) for i in range(200)]
+
+
+def test_drain_respects_budget(bridge, dispatched, mocker):
+    mocker.patch.object(bridge, "_get_frame_budget", return_value=0)
+    bridge.push("on_message", (1,), {})
+    bridge.push("on_message", (2,), {})
+    # With no time at all, only a single event is handled per run
+    assert bridge._drain() == GLib.SOURCE_CONTINUE
+    assert dispatched == [("on_message", (1,))]
+    bridge._drain()
+    assert bridge._drain() == GLib.SOURCE_REMOVE
+    assert dispatched == [("on_message", (1,)), ("on_message", (2,))]
+
+
+class FakeEntity:
+    def __init__(self, entity_id, state=None):
+        self.id = entity_id
+        self.state = state
+
+
+def test_coalescing(bridge, dispatched):
+    first = FakeEntity(1, "b")
+    other = FakeEntity(2)
+    bridge.push("on_user_update", (FakeEntity(1, "a"), first), {})
+    bridge.push("on_user_update", (other, other), {})
+    bridge.push("on_user_update", (FakeEntity(1, "b"), FakeEntity(1, "c")), {})
+    while bridge._drain() == GLib.SOURCE_CONTINUE:
+        pass
+
+    assert len(dispatched) == 2
+    before, after = dispatched[0][1]
+    # The whole change is kept
+    assert before.state == "a"
+    assert after.state == "c"
+    # Superseded by the later event
+    assert after is not first
+    assert dispatched[1][1] == (other, other)
+    assert bridge.coalesced_count == 1
+
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+
+
+class FakeMessage:
+    def __init__(self, channel_id, author_id=1):
+        self.channel = FakeChannel(channel_id)
+        self.author = FakeEntity(author_id)
+
+
+def test_priority_lane_first(dispatched):
+    bridge = EventBridge(
+        lambda name, args, kwargs, enqueued_at : dispatched.append((name, args)),
+        lambda : frozenset((1,))
+    )
+    other = FakeMessage(2)
+    opened = FakeMessage(1)
+    bridge.push("on_guild_update", (FakeEntity(1), FakeEntity(1)), {})
+    bridge.push("on_message", (other,), {})
+    bridge.push("on_message", (opened,), {})
+    while bridge._drain() == GLib.SOURCE_CONTINUE:
+        pass
+
+    assert dispatched[0] == ("on_message", (opened,))
+    assert [name for name, args in dispatched[1:]] == ["on_guild_update", "on_message"]
+
+
+def test_typing_not_merged_across_message(bridge, dispatched):
+    channel = FakeChannel(1)
+    user = FakeEntity(1)
+    message = FakeMessage(1, author_id=1)
+    bridge.push("on_typing", (channel, user, 1), {})
+    bridge.push("on_message", (message,), {})
+    bridge.push("on_typing", (channel, user, 2), {})
+    bridge.push("on_typing", (channel, user, 3), {})
+    while bridge._drain() == GLib.SOURCE_CONTINUE:
+        pass
+
+    # Typing after the message is still shown
+    assert dispatched == [
+        ("on_typing", (channel, user, 1)),
+        ("on_message", (message,)),
+        ("on_typing", (channel, user, 3))
+    ]
+
+
+def test_priority_lane_resync(dispatched):
+    bridge = EventBridge(
+        lambda name, args, kwargs, enqueued_at : dispatched.append((name, args)),
+        lambda : frozenset((1,))
+    )
+    bridge.priority_lane.capacity = 10
+    for i in range(11):
+        bridge.push("on_message", (FakeMessage(1),), {})
+    while bridge._drain() == GLib.SOURCE_CONTINUE:
+        pass
+
+    assert dispatched == [("on_resync_needed", ())]
+    assert bridge.resync_count == 1
+    assert bridge.shed_count == 1
+
+
+def test_default_lane_overload_coalesce(bridge, dispatched):
+    bridge.default_lane.capacity = 2
+    bridge.push("on_message", (1,), {})
+    bridge.push("on_guild_join", (1,), {})
+    bridge.push("on_message", (2,), {})
+    bridge.push("on_message", (3,), {})
+    bridge.push("on_member_join", (1,), {})
+    while bridge._drain() == GLib.SOURCE_CONTINUE:
+        pass
+
+    # Nothing queued for the same entity, so the messages are lost and
+    # replaced by a single resync, the member join can't be resynced
+    assert dispatched == [
+        ("on_message", (1,)),
+        ("on_guild_join", (1,)),
+        ("on_resync_needed", ()),
+        ("on_member_join", (1,))
+    ]
+    assert bridge.shed_count == 2
+    assert bridge.resync_count == 1
+
+
+def test_default_lane_overload_only_merges_same_entity(bridge, dispatched):
+    bridge.default_lane.capacity = 1
+    bridge.push("on_user_update", (FakeEntity(1, "a"), FakeEntity(1, "b")), {})
+    bridge.push("on_user_update", (FakeEntity(2, "x"), FakeEntity(2, "y")), {})
+    bridge.push("on_user_update", (FakeEntity(1, "b"), FakeEntity(1, "c")), {})
+    while bridge._drain() == GLib.SOURCE_CONTINUE:
+        pass
+
+    assert [name for name, args in dispatched] == ["on_user_update", "on_resync_needed"]
+    before, after = dispatched[0][1]
+    assert (before.id, before.state, after.id, after.state) == (1, "a", 1, "c")
+    assert bridge.shed_count == 1
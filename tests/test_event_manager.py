@@ -0,0 +1,175 @@
+import load_gtk
+import asyncio
+import gc
+import sys
+import pytest
+# Workaround from stackoverflow to allow importing the program
+sys.path.append("..")
+
+from gi.repository import Gio, GObject
+from mirdorph.event_manager import EventManager
+from mirdorph.event_receiver import EventReceiver
+
+
+@pytest.fixture()
+def event_manager():
+    # EventReceivers register against the default application
+    app = Gio.Application(application_id="org.gnome.gitlab.ranchester.MirdorphTests")
+    Gio.Application.set_default(app)
+    app.event_manager = EventManager()
+    yield app.event_manager
+    Gio.Application.set_default(None)
+
+
+class MessageReceiver(EventReceiver):
+    def __init__(self):
+        EventReceiver.__init__(self)
+        self.received = []
+
+    def disc_on_message(self, message):
+        self.received.append(message)
+
+
+def test_dispatch_to_subscriber(event_manager):
+    receiver = MessageReceiver()
+    event_manager.dispatch_event("on_message", "hello")
+    assert receiver.received == ["hello"]
+
+
+def test_only_overridden_events_indexed(event_manager):
+    # Only weakly referenced, kept alive until here
+    receivers = [MessageReceiver(), EventReceiver()]
+    assert event_manager.has_subscribers("on_message")
+    assert not event_manager.has_subscribers("on_typing")
+    assert len(event_manager._subscriptions["on_message"]) == 1
+    del receivers
+
+
+class FakeMobject(GObject.Object, EventReceiver):
+    def __init__(self, message_id):
+        GObject.Object.__init__(self)
+        EventReceiver.__init__(self)
+        self.id = message_id
+
+    def disc_on_message_edit(self, before, after):
+        pass
+
+
+def test_receivers_bounded_after_discarding(event_manager):
+    model = Gio.ListStore()
+    for i in range(10000):
+        model.append(FakeMobject(i))
+    assert event_manager.get_n_receivers() == 10000
+
+    model.remove_all()
+    gc.collect()
+    event_manager.dispatch_event("on_message_edit", None, None)
+    assert event_manager.get_n_receivers() == 0
+    assert not event_manager.has_subscribers("on_message_edit")
+
+
+def test_unregister(event_manager):
+    receiver = MessageReceiver()
+    event_manager.unregister_receiver(receiver)
+    event_manager.dispatch_event("on_message", "hello")
+    assert not receiver.received
+    assert not event_manager.has_subscribers("on_message")
+
+
+class ChannelMessageReceiver(MessageReceiver):
+    def __init__(self, channel_id):
+        EventReceiver.__init__(self, channel_id=channel_id)
+        self.received = []
+
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+
+
+class FakeMessage:
+    def __init__(self, channel_id):
+        self.channel = FakeChannel(channel_id)
+
+
+def test_channel_routing(event_manager):
+    first = ChannelMessageReceiver(1)
+    second = ChannelMessageReceiver(2)
+    everything = MessageReceiver()
+
+    message = FakeMessage(1)
+    event_manager.dispatch_event("on_message", message)
+    assert first.received == [message]
+    assert not second.received
+    assert everything.received == [message]
+
+
+def test_subscribed_events(event_manager):
+    assert "on_message" not in event_manager.get_subscribed_events()
+    receiver = ChannelMessageReceiver(1)
+    assert "on_message" in event_manager.get_subscribed_events()
+    event_manager.unregister_receiver(receiver)
+    assert "on_message" not in event_manager.get_subscribed_events()
+
+
+def test_stats_collected_when_enabled(event_manager):
+    event_manager.stats.enabled = True
+    receiver = MessageReceiver()
+    event_manager.dispatch_event("on_message", "hello")
+    event_manager.stats.record_latency("on_message", 0.003)
+
+    stats = event_manager.stats.to_dict()
+    assert stats["event_counts"] == {"on_message": 1}
+    assert stats["latency_histograms"]["on_message"]["<=5ms"] == 1
+    assert stats["handlers"]["MessageReceiver.disc_on_message"]["calls"] == 1
+    assert receiver.received == ["hello"]
+
+
+class AsyncMessageReceiver(EventReceiver):
+    def __init__(self, channel_id=None):
+        EventReceiver.__init__(self, channel_id=channel_id)
+        self.received = []
+
+    async def disc_on_message(self, message):
+        self.received.append(message)
+
+
+def test_async_handlers_run_on_loop(event_manager):
+    receiver = AsyncMessageReceiver(channel_id=1)
+    assert "on_message" in event_manager.get_async_subscribed_events()
+    assert "on_message" not in event_manager.get_sync_subscribed_events()
+
+    # Not run by the GTK side dispatching
+    event_manager.dispatch_event("on_message", FakeMessage(1))
+    assert not receiver.received
+
+    async def dispatch():
+        event_manager.dispatch_async_event("on_message", FakeMessage(2))
+        event_manager.dispatch_async_event("on_message", message)
+        await asyncio.sleep(0)
+
+    message = FakeMessage(1)
+    asyncio.run(dispatch())
+    assert receiver.received == [message]
+
+
+class FailingAsyncReceiver(EventReceiver):
+    async def disc_on_message(self, message):
+        raise ValueError("handler failed")
+
+
+def test_async_handler_tasks_kept_and_errors_logged(event_manager, caplog):
+    receiver = FailingAsyncReceiver()
+
+    async def dispatch():
+        event_manager.dispatch_async_event("on_message", FakeMessage(1))
+        assert len(event_manager._async_handler_tasks) == 1
+        # The task runs, and then its done callback
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    asyncio.run(dispatch())
+    assert not event_manager._async_handler_tasks
+    assert "error in async handler for on_message" in caplog.text
+    # Only weakly referenced, kept alive until here
+    del receiver
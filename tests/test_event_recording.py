@@ -0,0 +1,75 @@
+import load_gtk
+import datetime
+import sys
+import pytest
+# Workaround from stackoverflow to allow importing the program
+sys.path.append("..")
+
+from mirdorph.event_recording import EventRecorder, RecordedObject, read_recording
+
+
+class FakeGuild:
+    def __init__(self):
+        self.id = 1
+        self.name = "guild"
+
+
+class FakeChannel:
+    def __init__(self):
+        self.id = 2
+        self.name = "general"
+        self.guild = FakeGuild()
+
+
+class FakeUser:
+    def __init__(self):
+        self.id = 3
+        self.name = "user"
+
+    @property
+    def display_name(self):
+        raise AttributeError("not cached")
+
+
+class FakeMessage:
+    def __init__(self):
+        self.id = 4
+        self.content = "hello"
+        self.created_at = datetime.datetime(2021, 6, 1, 12, 0)
+        self.channel = FakeChannel()
+        self.author = FakeUser()
+        self.mentions = [FakeUser()]
+
+
+@pytest.fixture()
+def recording_path(tmp_path):
+    recorder = EventRecorder(tmp_path / "events.jsonl.gz")
+    recorder.record("on_message", (FakeMessage(),), {})
+    recorder.record("on_typing", (FakeChannel(), FakeUser(), datetime.datetime(2021, 6, 1)), {})
+    recorder.close()
+    return tmp_path / "events.jsonl.gz"
+
+
+def test_round_trip(recording_path):
+    events = list(read_recording(recording_path))
+    assert [name for _, name, _, _ in events] == ["on_message", "on_typing"]
+
+    _, _, (message,), kwargs = events[0]
+    assert kwargs == {}
+    assert isinstance(message, RecordedObject)
+    assert message.content == "hello"
+    assert message.created_at == datetime.datetime(2021, 6, 1, 12, 0)
+    assert message.channel.guild.name == "guild"
+    assert message.mentions == [message.author]
+    assert not hasattr(message.author, "display_name")
+
+    _, _, (channel, user, when), _ = events[1]
+    assert channel == message.channel
+    assert hash(user) == hash(message.author)
+
+
+def test_truncated_recording(recording_path):
+    data = recording_path.read_bytes()
+    recording_path.write_bytes(data[:len(data) // 2])
+    # Shouldn't raise, just stop where the file was cut off
+    list(read_recording(recording_path))
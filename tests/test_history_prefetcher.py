@@ -0,0 +1,58 @@
+import sys
+import pytest
+# Workaround from stackoverflow to allow importing the program
+sys.path.append("..")
+
+from mirdorph.history_prefetcher import HistoryPrefetcher
+
+# 100 messages of 50 pixels, a viewport of 10 of them
+UPPER = 5000
+PAGE_SIZE = 500
+N_MESSAGES = 100
+
+
+@pytest.fixture()
+def prefetcher():
+    return HistoryPrefetcher()
+
+
+def test_page_size_follows_viewport(prefetcher):
+    assert prefetcher.get_page_size(PAGE_SIZE, 50) == 30
+    assert prefetcher.get_page_size(2000, 50) == 100
+    assert prefetcher.get_page_size(PAGE_SIZE, 0) == HistoryPrefetcher.MIN_PAGE_SIZE
+
+
+def test_slow_scrolling_loads_near_top(prefetcher):
+    assert prefetcher.update(3000, PAGE_SIZE, UPPER, N_MESSAGES, now=0) == 0
+    assert prefetcher.update(2990, PAGE_SIZE, UPPER, N_MESSAGES, now=1) == 0
+    assert prefetcher.update(900, PAGE_SIZE, UPPER, N_MESSAGES, now=200) > 0
+
+
+def test_fast_scrolling_loads_earlier(prefetcher):
+    # 2000 pixels a second
+    value = UPPER
+    for i in range(50):
+        value = UPPER - i * 100
+        if prefetcher.update(value, PAGE_SIZE, UPPER, N_MESSAGES, now=i * 0.05):
+            break
+    # Well before it would have been without scrolling fast
+    assert value > PAGE_SIZE * HistoryPrefetcher.LOOKAHEAD_VIEWPORTS * 2
+
+
+def test_hits_and_misses(prefetcher):
+    prefetcher.load_started(now=0)
+    # Nothing new while a page is loading
+    assert prefetcher.update(100, PAGE_SIZE, UPPER, N_MESSAGES, now=0.1) == 0
+    prefetcher.load_finished(now=0.2)
+    assert (prefetcher.hits, prefetcher.misses) == (1, 0)
+
+    prefetcher.load_started(now=1)
+    # Reached the top while waiting
+    prefetcher.update(0, PAGE_SIZE, UPPER, N_MESSAGES, now=1.1)
+    prefetcher.load_finished(now=1.5)
+    assert (prefetcher.hits, prefetcher.misses) == (1, 1)
+
+    prefetcher.load_started(now=2)
+    prefetcher.load_finished(succeeded=False, now=2.5)
+    assert prefetcher.get_stats()["hits"] == 1
+    assert prefetcher.get_stats()["misses"] == 1
@@ -0,0 +1,92 @@
+import load_gtk
+import sys
+import pytest
+# Workaround from stackoverflow to allow importing the program
+sys.path.append("..")
+
+from gi.repository import GObject
+from mirdorph.message_list_model import MessageListModel
+
+
+class Item(GObject.Object):
+    def __init__(self, id=None):
+        GObject.Object.__init__(self)
+        self.id = id
+
+
+@pytest.fixture()
+def changes():
+    return []
+
+
+@pytest.fixture()
+def model(changes):
+    model = MessageListModel(Item())
+    model.connect(
+        "items-changed",
+        lambda model, position, removed, added : changes.append((position, removed, added))
+    )
+    return model
+
+
+def get_ids(model: MessageListModel) -> list:
+    return [model.get_message(i).id for i in range(model.get_n_messages())]
+
+
+def test_header_first(model):
+    assert model.get_n_items() == 1
+    assert model.get_item(0).id is None
+    model.insert([Item(5)])
+    assert model.get_n_items() == 2
+    assert model.get_item(0).id is None
+    assert model.get_item(1).id == 5
+
+
+def test_sorted_and_minimal_changes(model, changes):
+    model.insert([Item(i) for i in (50, 40, 60)])
+    # A page of older history is a single change after the header
+    model.insert([Item(i) for i in range(10, 20)])
+    # A new message at the end
+    model.insert([Item(70)])
+    assert get_ids(model) == list(range(10, 20)) + [40, 50, 60, 70]
+    assert changes == [(1, 0, 3), (1, 0, 10), (14, 0, 1)]
+
+
+def test_insert_between_and_dupes(model, changes):
+    model.insert([Item(10), Item(20), Item(30)])
+    changes.clear()
+    inserted = model.insert([Item(35), Item(20), Item(15), Item(15), Item(16)])
+    assert [item.id for item in inserted] == [15, 16, 35]
+    assert get_ids(model) == [10, 15, 16, 20, 30, 35]
+    # Positions as they are after the changes before them
+    assert changes == [(2, 0, 2), (6, 0, 1)]
+
+
+def test_remove(model, changes):
+    model.insert([Item(i) for i in range(10)])
+    changes.clear()
+    assert model.remove(3).id == 3
+    assert model.remove(3) is None
+    assert model.index_of(4) == 3
+    assert [item.id for item in model.remove_range(0, 2)] == [0, 1]
+    assert changes == [(4, 1, 0), (1, 2, 0)]
+    assert len(model.remove_all()) == 7
+    assert model.get_n_items() == 1
+
+
+def test_remove_ids_in_runs(model, changes):
+    model.insert([Item(i) for i in range(10)])
+    changes.clear()
+    removed = model.remove_ids([2, 3, 4, 8, 42])
+    assert [item.id for item in removed] == [2, 3, 4, 8]
+    assert get_ids(model) == [0, 1, 5, 6, 7, 9]
+    # The later run first, so the position of the other one stays right
+    assert changes == [(9, 1, 0), (3, 3, 0)]
+
+
+def test_update(model, changes):
+    model.insert([Item(i) for i in range(3)])
+    changes.clear()
+    assert model.update(1)
+    assert not model.update(5)
+    assert changes == [(2, 1, 1)]
@@ -5,7 +5,7 @@ sys.path.append("..")
 # Message parsing has gresource templates, and linkpreview uses handy
 import tests.load_gtk
 from mirdorph.link_preview import LinkPreviewExport
-from mirdorph.message_parsing import _create_pango_markup, calculate_msg_parts, _generate_exports, ComponentType
+from mirdorph.message_parsing import _create_pango_markup, calculate_msg_parts, parse_message, _generate_exports, ComponentType
 
 def test_create_pango_markup_links():
     test_text = """\
@@ -63,3 +63,19 @@ However the bot said that:
 
     assert correct_components == components
 
+
+def test_parse_message():
+    example_message = """\
+Look at https://example.com
+> **quoted**"""
+
+    parsed_components = parse_message(example_message)
+
+    assert [parsed.component_type for parsed in parsed_components] == [
+        ComponentType.STANDARD,
+        ComponentType.QUOTE
+    ]
+    assert parsed_components[0].markup == _create_pango_markup("Look at https://example.com")
+    assert parsed_components[0].links == ["https://example.com"]
+    assert parsed_components[1].markup == _create_pango_markup("**quoted**")
+    assert parsed_components[1].links == []
@@ -0,0 +1,66 @@
+import sys
+import pytest
+# Workaround from stackoverflow to allow importing the program
+sys.path.append("..")
+
+from mirdorph.message_store import MessageStore
+
+
+@pytest.fixture()
+def store(tmp_path):
+    store = MessageStore(path=tmp_path / "messages.db")
+    yield store
+    store.close()
+
+
+def create_payloads(ids) -> list:
+    return [{"id": str(message_id), "content": f"message {message_id}"} for message_id in ids]
+
+
+def get_ids(payloads: list) -> list:
+    return [int(payload["id"]) for payload in payloads]
+
+
+def test_latest_newest_first(store):
+    store.store_messages(1, create_payloads(range(10, 20)))
+    store.store_messages(2, create_payloads(range(20, 30)))
+    assert get_ids(store.get_latest_messages(1, 3)) == [19, 18, 17]
+    assert store.get_latest_messages(1, 3)[0]["content"] == "message 19"
+    assert get_ids(store.get_latest_messages(3, 3)) == []
+
+
+def test_latest_page_with_gap_replaces(store):
+    store.store_messages(1, create_payloads(range(10, 20)))
+    # Overlapping, so there is no gap
+    store.store_messages(1, create_payloads(range(15, 25)), latest=True)
+    assert len(store.get_latest_messages(1, 100)) == 15
+    # Everything stored is older, there could be missing messages in between
+    store.store_messages(1, create_payloads(range(40, 45)), latest=True)
+    assert get_ids(store.get_latest_messages(1, 100)) == [44, 43, 42, 41, 40]
+
+
+def test_oldest_dropped(store):
+    store.store_messages(1, create_payloads(range(MessageStore.MAX_MESSAGES_PER_CHANNEL + 10)))
+    ids = get_ids(store.get_latest_messages(1, MessageStore.MAX_MESSAGES_PER_CHANNEL * 2))
+    assert len(ids) == MessageStore.MAX_MESSAGES_PER_CHANNEL
+    assert ids[-1] == 10
+
+
+def test_persistence_and_clear(tmp_path, store):
+    store.store_messages(1, create_payloads([5]))
+    second_store = MessageStore(path=tmp_path / "messages.db")
+    assert get_ids(second_store.get_latest_messages(1, 10)) == [5]
+    second_store.clear()
+    assert store.get_latest_messages(1, 10) == []
+    second_store.close()
+
+
+def test_update_and_delete(store):
+    store.store_messages(1, create_payloads(range(5)))
+    store.update_message(3, {"content": "edited"})
+    # Not stored, so still not
+    store.update_message(42, {"content": "edited"})
+    store.delete_messages([1, 2, 42])
+    payloads = store.get_latest_messages(1, 10)
+    assert get_ids(payloads) == [4, 3, 0]
+    assert payloads[1] == {"id": "3", "content": "edited"}
@@ -0,0 +1,145 @@
+import load_gtk
+import asyncio
+import sys
+import threading
+import pytest
+# Workaround from stackoverflow to allow importing the program
+sys.path.append("..")
+
+from gi.repository import Gio, GLib
+from mirdorph.scheduler import TaskScheduler, TaskCategory, CancellationScope, run_on_discord, get_discord_tasks_in_flight
+
+
+@pytest.fixture()
+def scheduler():
+    scheduler = TaskScheduler()
+    yield scheduler
+    scheduler.shutdown()
+
+
+def test_submit_result(scheduler):
+    future = scheduler.submit(TaskCategory.NETWORK, lambda a, b : a + b, 1, b=2)
+    assert future.result(timeout=5) == 3
+
+
+def test_category_limit_and_queue_depth(scheduler):
+    release = threading.Event()
+    workers = TaskScheduler.CATEGORY_WORKERS[TaskCategory.IO]
+    futures = [
+        scheduler.submit(TaskCategory.IO, release.wait)
+        for _ in range(workers + 3)
+    ]
+    # Only as many as there are workers can run, the rest are waiting
+    while scheduler.get_stats()["io"]["running"] < workers:
+        pass
+    assert scheduler.get_queue_depth(TaskCategory.IO) == 3
+    assert scheduler.get_queue_depth(TaskCategory.NETWORK) == 0
+
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    assert scheduler.get_queue_depth() == 0
+    assert scheduler.get_stats()["io"]["running"] == 0
+
+
+def test_cancelled_tasks_leave_queue(scheduler):
+    release = threading.Event()
+    workers = TaskScheduler.CATEGORY_WORKERS[TaskCategory.IO]
+    running = [scheduler.submit(TaskCategory.IO, release.wait) for _ in range(workers)]
+    queued = [scheduler.submit(TaskCategory.IO, release.wait) for _ in range(3)]
+    while scheduler.get_stats()["io"]["running"] < workers:
+        pass
+
+    for future in queued:
+        assert future.cancel()
+    assert scheduler.get_queue_depth(TaskCategory.IO) == 0
+
+    release.set()
+    for future in running:
+        future.result(timeout=5)
+    assert scheduler.get_stats()["io"] == {"queued": 0, "running": 0, "workers": workers}
+
+
+@pytest.fixture()
+def discord_loop():
+    # Like the real program, the discord loop runs on a different thread
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    app = Gio.Application(application_id="org.gnome.gitlab.ranchester.MirdorphTests")
+    Gio.Application.set_default(app)
+    app.discord_loop = loop
+    yield loop
+    Gio.Application.set_default(None)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def wait_for_main_context(results: list):
+    context = GLib.MainContext.default()
+    while not results:
+        context.iteration(True)
+
+
+def test_run_on_discord(discord_loop):
+    async def get_loop_thread():
+        return threading.current_thread()
+
+    results = []
+    run_on_discord(get_loop_thread(), callback=lambda thread : results.append(
+        (thread, threading.current_thread())
+    ))
+    wait_for_main_context(results)
+    loop_thread, callback_thread = results[0]
+    assert loop_thread is not threading.current_thread()
+    assert callback_thread is threading.current_thread()
+
+
+def test_run_on_discord_error(discord_loop):
+    async def fail():
+        raise ValueError("failed")
+
+    results = []
+    run_on_discord(fail(), callback=results.append, error_callback=results.append)
+    wait_for_main_context(results)
+    assert isinstance(results[0], ValueError)
+
+
+def test_discord_tasks_in_flight(discord_loop):
+    release = threading.Event()
+
+    async def wait_for_release():
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+
+    results = []
+    run_on_discord(wait_for_release(), callback=results.append)
+    assert get_discord_tasks_in_flight() == 1
+    release.set()
+    wait_for_main_context(results)
+    assert get_discord_tasks_in_flight() == 0
+
+
+def test_cancellation_scope(discord_loop):
+    started = threading.Event()
+    coroutine_cancelled = threading.Event()
+
+    async def download():
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            coroutine_cancelled.set()
+            raise
+
+    results = []
+    scope = CancellationScope()
+    scope.run_on_discord(download(), callback=results.append, error_callback=results.append)
+    started.wait(timeout=5)
+    scope.cancel()
+    assert coroutine_cancelled.wait(timeout=5)
+
+    # Nothing new is started once cancelled either
+    assert scope.run_on_discord(download(), callback=results.append) is None
+    assert not results